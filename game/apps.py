@@ -1,5 +1,19 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.signals import request_started
 
 
 class GameConfig(AppConfig):
     name = 'game'
+
+    def ready(self):
+        # Connects the signals that keep the game cache in sync with saves
+        import game.cache  # noqa: F401
+        # Sets up every new SQLite connection for SQLITE_MODE
+        import game.database  # noqa: F401
+        # Registers the archive model, nothing else imports it on startup
+        import game.models.archive  # noqa: F401
+
+        if settings.GAME_PROFILER_INTERVAL:
+            from game.profiler import start_on_request
+            request_started.connect(start_on_request, dispatch_uid='game.profiler')
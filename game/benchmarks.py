@@ -0,0 +1,376 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import timeit
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.test import Client, override_settings
+from django.utils import timezone
+from game.cache import forget_game
+from game.database import SQLITE_MODES
+from game.events import game_group, move_event
+from game.export import EXPORT_BATCH, export_games
+from game.layers import LocalChannelLayer
+from game.models.helpers.board import generate_game, generate_empty_game, propagate_unhide, extract_adjacent, \
+    tile_coordinates, serialize_game, deserialize_game, count_bombs, count_hidden
+from game.models.helpers.solver import generate_no_guess_game
+from game.models.helpers.bitwise_operations import is_hidden, is_bomb, is_flagged, set_hidden
+from game.models.game import Game, MoveConflict
+from game.renderers import GameJSONRenderer, Base64BoardRenderer
+from game.serializers import GameSerializer
+from rest_framework.renderers import JSONRenderer
+
+
+def recursive_propagate_unhide(grid, width, height):
+    """
+    The original full board rescan, kept as a baseline for the flood fill benchmark
+    """
+    modified = 0
+    for y in range(0, height):
+        for x in range(0, width):
+            tile = grid[y][x]
+            if not is_hidden(tile) and not is_bomb(tile) and extract_adjacent(tile) == 0:
+                for y_offset in range(-1, 2):
+                    y_probe = y + y_offset
+                    if 0 <= y_probe < height:
+                        for x_offset in range(-1, 2):
+                            x_probe = x + x_offset
+                            if 0 <= x_probe < width:
+                                tile_probe = grid[y_probe][x_probe]
+                                if is_hidden(tile_probe):
+                                    grid[y_probe][x_probe] = set_hidden(False, tile_probe)
+                                    modified += 1
+
+    if modified > 0:
+        return recursive_propagate_unhide(grid, width, height)
+    return grid
+
+
+def find_opening(grid):
+    for index, tile in enumerate(grid):
+        if not is_bomb(tile) and extract_adjacent(tile) == 0:
+            return index
+    raise ValueError('Board has no tile without adjacent bombs')
+
+
+def bench_propagate_unhide(width=32, height=32, density=0.05, number=20, seed=0):
+    """
+    Times a single opening click with the flood fill against the recursive rescan it replaced
+    :return: dict of milliseconds per click for each implementation
+    """
+    board = generate_game(generate_empty_game(width, height), width, height, width // 2, height // 2, density, seed)
+    x, y = tile_coordinates(find_opening(board), width)
+    rows = [list(board[row * width:(row + 1) * width]) for row in range(0, height)]
+
+    def flood_fill():
+        propagate_unhide(bytearray(board), width, height, x, y)
+
+    def recursive():
+        grid = [row[:] for row in rows]
+        grid[y][x] = set_hidden(False, grid[y][x])
+        recursive_propagate_unhide(grid, width, height)
+
+    return {
+        'flood_fill (ms)': timeit.timeit(flood_fill, number=number) / number * 1000,
+        'recursive (ms)': timeit.timeit(recursive, number=number) / number * 1000,
+    }
+
+
+def bench_generate_game(sizes=(8, 32, 1000), densities=(0.1, 0.15, 0.2), number=5, seed=0):
+    """
+    Times generating square boards of each size and density
+    :return: dict of milliseconds per board for each size and density
+    """
+    results = {}
+    for size in sizes:
+        for density in densities:
+            def generate():
+                generate_game(generate_empty_game(size, size), size, size, size // 2, size // 2, density, seed)
+            label = '{0}x{0} at {1:.0%} (ms)'.format(size, density)
+            results[label] = timeit.timeit(generate, number=number) / number * 1000
+    return results
+
+
+def started_game(size, density=0.15, seed=0):
+    """
+    :return: unsaved game of the size with its first reveal in the middle played
+    """
+    game = Game(width=size, height=size, game_state='S')
+    game.state = generate_game(generate_empty_game(size, size), size, size, size // 2, size // 2, density, seed)
+    propagate_unhide(game.state, size, size, size // 2, size // 2)
+    game.bombs = count_bombs(game.state)
+    return game
+
+
+def bench_board(sizes=(8, 32, 256, 1024), number=50):
+    """
+    Times the whole board operations every request makes: decoding and encoding the stored board, scrubbing it into
+    client_state, and counting bombs and hidden tiles
+    :return: dict of milliseconds per call for each size and operation
+    """
+    results = {}
+    for size in sizes:
+        game = started_game(size)
+        state = serialize_game(game.state)
+        operations = (
+            ('deserialize_game', lambda: deserialize_game(state, size, size)),
+            ('serialize_game', lambda: serialize_game(game.state)),
+            ('client_state', lambda: game.client_state),
+            ('count_bombs', lambda: count_bombs(state)),
+            ('count_hidden', lambda: count_hidden(state)),
+        )
+        for name, operation in operations:
+            label = '{0}x{0} {1} (ms)'.format(size, name)
+            results[label] = timeit.timeit(operation, number=number) / number * 1000
+    return results
+
+
+def bench_no_guess(sizes=(16, 32), densities=(0.1, 0.15, 0.2), boards=10, seed=0):
+    """
+    Times generating boards that can be solved without guessing, and counts how many boards were thrown away
+    :return: dict of milliseconds per board and percentage of boards rejected for each size and density
+    """
+    results = {}
+    for size in sizes:
+        for density in densities:
+            attempts = 0
+            started = timeit.default_timer()
+            for board in range(0, boards):
+                generated, solvable = generate_no_guess_game(generate_empty_game(size, size), size, size,
+                                                             size // 2, size // 2, density, seed + board)
+                attempts += generated
+            label = '{0}x{0} at {1:.0%}'.format(size, density)
+            results[label + ' (ms)'] = (timeit.default_timer() - started) / boards * 1000
+            results[label + ' rejected (%)'] = (attempts - boards) / attempts * 100
+    return results
+
+
+def bench_render_board(sizes=(32, 256), density=0.15, number=20, seed=0):
+    """
+    Renders a started game of each size with the stock JSON renderer, the lookup table renderer and as base64
+    :return: dict of milliseconds per response and bytes per response for each size and renderer
+    """
+    results = {}
+    for size in sizes:
+        data = GameSerializer(started_game(size, density, seed)).data
+
+        renderers = (('json', JSONRenderer()), ('table', GameJSONRenderer()), ('base64', Base64BoardRenderer()))
+        for name, renderer in renderers:
+            label = '{0}x{0} {1}'.format(size, name)
+            results[label + ' (ms)'] = timeit.timeit(lambda: renderer.render(data), number=number) / number * 1000
+            results[label + ' (bytes)'] = len(renderer.render(data))
+    return results
+
+
+def percentile(timings, fraction):
+    timings = sorted(timings)
+    return timings[min(int(len(timings) * fraction), len(timings) - 1)]
+
+
+@contextmanager
+def scratch_database():
+    """
+    Points the default database at a new SQLite file with every migration applied, so each request commits to disk like
+    it would when serving players without touching the real database. The file is deleted afterwards.
+    """
+    directory = tempfile.mkdtemp()
+    name = connection.settings_dict['NAME']
+    connection.close()
+    connection.settings_dict['NAME'] = os.path.join(directory, 'bench.sqlite3')
+    try:
+        call_command('migrate', verbosity=0, interactive=False)
+        yield
+    finally:
+        connection.close()
+        connection.settings_dict['NAME'] = name
+        shutil.rmtree(directory)
+
+
+def bench_api(games=20, moves=20, size=16, seed=0):
+    """
+    Plays games through the API with the test client: creates each game, reveals the middle, then flags and reveals
+    random hidden tiles until it ends or has had the given number of moves. Every request commits its own changes, in a
+    scratch database.
+    :return: dict of p50 and p99 milliseconds for each type of request made, and requests per second over the whole run
+    """
+    client = Client(SERVER_NAME='localhost')
+    random_state = numpy.random.RandomState(seed)
+    timings = {'create': [], 'reveal': [], 'flag': []}
+    created = []
+
+    def request(kind, url, data):
+        started = timeit.default_timer()
+        response = client.post(url, data)
+        timings[kind].append((timeit.default_timer() - started) * 1000)
+        return response
+
+    with scratch_database():
+        started = timeit.default_timer()
+        for number in range(0, games):
+            game = request('create', '/api/games/', {'width': size, 'height': size}).data
+            created.append(game['id'])
+            url = '/api/games/{}/'.format(game['id'])
+            game = request('reveal', url + 'reveal/', {'x': size // 2, 'y': size // 2}).data
+            for move in range(1, moves):
+                if game['game_state'] != 'S':
+                    break
+                hidden = [(x, y) for y, row in enumerate(game['client_state']) for x, tile in enumerate(row)
+                          if is_hidden(tile) and not is_flagged(tile)]
+                x, y = hidden[random_state.randint(len(hidden))]
+                kind = 'flag' if random_state.randint(4) == 0 else 'reveal'
+                game = request(kind, url + kind + '/', {'x': x, 'y': y}).data
+        elapsed = timeit.default_timer() - started
+
+        # Ids start again in the scratch database, its games must not be mistaken for real ones
+        for pk in created:
+            forget_game(pk)
+    results = {'requests per second': sum(len(kind) for kind in timings.values()) / elapsed}
+    for kind, kind_timings in timings.items():
+        if not kind_timings:
+            continue
+        results[kind + ' p50 (ms)'] = percentile(kind_timings, 0.5)
+        results[kind + ' p99 (ms)'] = percentile(kind_timings, 0.99)
+    return results
+
+
+def sqlite_worker(games, moves, seed):
+    """
+    Plays flags on random games the way a worker process serves them: each move loads the game, as a poll would, then
+    saves the move with Game.play_moves. Runs in a forked process, so it opens its own connections first.
+    :return: number of moves saved, number that failed with database is locked or too many conflicting moves
+    """
+    connections.close_all()
+    random_state = numpy.random.RandomState(seed)
+    saved = 0
+    failed = 0
+    for move in range(0, moves):
+        try:
+            game = Game.objects.get(pk=games[random_state.randint(len(games))])
+            hidden = [index for index, tile in enumerate(game.state) if is_hidden(tile)]
+            index = hidden[random_state.randint(len(hidden))]
+            game.play_moves([('flag', index % game.width, index // game.width)])
+            saved += 1
+        except (OperationalError, MoveConflict):
+            failed += 1
+    connections.close_all()
+    return saved, failed
+
+
+def bench_sqlite_writes(processes=(1, 4, 8), moves=200, games=16, size=32):
+    """
+    Saves moves from several processes at once into a scratch database in each SQLITE_MODE
+    :return: dict of moves saved, moves saved per second and percentage of moves that failed for each mode and number of
+    processes
+    """
+    results = {}
+    context = multiprocessing.get_context('fork')
+    for mode in sorted(SQLITE_MODES):
+        for count in processes:
+            with override_settings(SQLITE_MODE=mode), scratch_database():
+                created = []
+                for number in range(0, games):
+                    game = Game.objects.create(width=size, height=size)
+                    game.play_moves([('reveal', size // 2, size // 2)])
+                    created.append(game.pk)
+                # Forked processes must not share the open connection
+                connection.close()
+
+                started = timeit.default_timer()
+                with context.Pool(count) as pool:
+                    outcomes = pool.starmap(sqlite_worker, [(created, moves, seed) for seed in range(count)])
+                elapsed = timeit.default_timer() - started
+
+            saved = sum(outcome[0] for outcome in outcomes)
+            failed = sum(outcome[1] for outcome in outcomes)
+            label = '{} with {} processes'.format(mode, count)
+            results[label + ' saved'] = saved
+            results[label + ' (moves/s)'] = saved / elapsed
+            results[label + ' failed (%)'] = failed / (saved + failed) * 100
+    return results
+
+
+def bench_spectators(spectators=(10, 100, 500), size=64, number=10, seed=0):
+    """
+    Sends a flag on a started game to each number of spectators, once by every spectator polling the whole game and once
+    by encoding the move once and broadcasting it through an in-memory channel layer
+    :return: dict of milliseconds to reach every spectator for each number of spectators
+    """
+    game = started_game(size, seed=seed)
+    game.pk = 1
+    hidden = next(index for index, tile in enumerate(game.state) if is_hidden(tile))
+    changed, applied = game.apply_moves([('flag', hidden % size, hidden // size)])
+
+    async def broadcast(layer, channels):
+        started = timeit.default_timer()
+        for _ in range(0, number):
+            await layer.group_send(game_group(game.pk), move_event(game, changed))
+            for channel in channels:
+                await layer.receive(channel)
+        return timeit.default_timer() - started
+
+    async def subscribe_and_broadcast(count):
+        layer = LocalChannelLayer(capacity=number + 1)
+        channels = [await layer.new_channel() for _ in range(0, count)]
+        for channel in channels:
+            await layer.group_add(game_group(game.pk), channel)
+        return await broadcast(layer, channels)
+
+    renderer = GameJSONRenderer()
+    results = {}
+    for count in spectators:
+        label = '{} spectators'.format(count)
+        poll = timeit.timeit(lambda: [renderer.render(GameSerializer(game).data) for _ in range(0, count)],
+                             number=number)
+        results[label + ' polling (ms)'] = poll / number * 1000
+        results[label + ' broadcast (ms)'] = async_to_sync(subscribe_and_broadcast)(count) / number * 1000
+    return results
+
+
+def bench_export(cases=((1000, 32), (10000, 32), (20, 1024)), batch=EXPORT_BATCH, seed=0):
+    """
+    Exports each number of finished games of each size as NDJSON, adding the games in a transaction that is rolled back
+    afterwards
+    :param cases: list of (number of games, board size)
+    :return: dict of games exported per second and peak memory allocated while exporting for each case
+    """
+    results = {}
+    for count, size in cases:
+        game = started_game(size, seed=seed)
+        with transaction.atomic():
+            for start in range(0, count, batch):
+                Game.objects.bulk_create(
+                    Game(width=size, height=size, bombs=game.bombs, game_state='L', start_time=timezone.now(),
+                         end_time=timezone.now(), state=game.state)
+                    for _ in range(start, min(start + batch, count)))
+
+            tracemalloc.start()
+            started = timeit.default_timer()
+            written = sum(chunk.count('\n') for chunk in export_games('ndjson', batch))
+            elapsed = timeit.default_timer() - started
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            transaction.set_rollback(True)
+
+        label = '{0} games of {1}x{1}'.format(count, size)
+        results[label + ' (games/s)'] = written / elapsed
+        results[label + ' peak memory (MB)'] = peak / 1024 / 1024
+    return results
+
+
+BENCHMARKS = {
+    'api': bench_api,
+    'board': bench_board,
+    'export': bench_export,
+    'generate_game': bench_generate_game,
+    'no_guess': bench_no_guess,
+    'propagate_unhide': bench_propagate_unhide,
+    'render_board': bench_render_board,
+    'spectators': bench_spectators,
+    'sqlite_writes': bench_sqlite_writes,
+}
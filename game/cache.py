@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from game.models.game import Game
+
+# Games in progress are kept in this cache so moves can skip loading them from the database.
+# Moves still save straight to the database with a compare and swap on the version, so a stale copy from the cache
+# can never overwrite a newer move, the move is replayed on a fresh copy instead. See Game.play_moves
+GAME_CACHE = 'games'
+
+FIELDS = [field.attname for field in Game._meta.concrete_fields]
+
+
+def cache_key(pk):
+    return 'game:{}'.format(pk)
+
+
+def load_game(pk, version=None):
+    """
+    Loads a game from the cache, falling back to the database on a miss
+    :param version: version the game has in the database, a cached copy of any other version is not used. Pass it for
+    reads that are not protected by the version check moves are saved with, as each process has its own cache.
+    :raises Game.DoesNotExist: if there is no game with that primary key
+    """
+    values = caches[GAME_CACHE].get(cache_key(pk))
+    if values is not None:
+        game = Game.from_db('default', FIELDS, values, rebuild_board=False)
+        if version is None or game.version == version:
+            return game
+
+    game = Game.objects.get(pk=pk)
+    store_game(game)
+    return game
+
+
+def store_game(game):
+    """
+    Caches a game that is in progress, or drops it from the cache once it is over or too big to keep
+    """
+    if game.game_state == 'S' and len(game.state) <= settings.GAME_CACHE_MAX_BOARD_BYTES:
+        caches[GAME_CACHE].set(cache_key(game.pk), [getattr(game, field) for field in FIELDS])
+    else:
+        forget_game(game.pk)
+
+
+def forget_game(pk):
+    caches[GAME_CACHE].delete(cache_key(pk))
+
+
+@receiver(post_save, sender=Game)
+@receiver(post_delete, sender=Game)
+def forget_saved_game(sender, instance, *args, **kwargs):
+    # Saves outside of moves do not go through the version check, so the cached copy can no longer be trusted
+    forget_game(instance.pk)
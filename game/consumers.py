@@ -0,0 +1,68 @@
+from asgiref.sync import async_to_sync
+from channels.generic.websocket import JsonWebsocketConsumer
+
+from game.cache import load_game, store_game, forget_game
+from game.events import game_group, publish_move
+from game.models.game import Game, MoveConflict
+from game.serializers import GameSerializer, MoveSerializer
+
+
+class GameConsumer(JsonWebsocketConsumer):
+    """
+    Plays a game over a websocket.
+    Clients send {"action": "reveal", "flag" or "chord", "x": x, "y": y} and every socket open on the game is sent the
+    tiles each move changed, in the same layout as a delta response from the HTTP API.
+    """
+    actions = ('reveal', 'flag', 'chord')
+
+    def connect(self):
+        self.pk = self.scope['url_route']['kwargs']['pk']
+        game = Game.objects.filter(pk=self.pk).first()
+        if game is None:
+            self.close()
+            return
+
+        async_to_sync(self.channel_layer.group_add)(game_group(self.pk), self.channel_name)
+        self.accept()
+        self.send_json({'type': 'game', 'game': GameSerializer(game).data})
+
+    def disconnect(self, code):
+        async_to_sync(self.channel_layer.group_discard)(game_group(self.pk), self.channel_name)
+
+    def receive_json(self, content, **kwargs):
+        action = content.get('action')
+        if action not in self.actions:
+            errors = {'action': ['Must be one of {}'.format(', '.join(self.actions))]}
+            self.send_json({'type': 'error', 'errors': errors})
+            return
+
+        try:
+            game = load_game(self.pk)
+        except Game.DoesNotExist:
+            self.close()
+            return
+        if not game.in_progress:
+            self.send_json({'type': 'error', 'status': 'Cannot update completed game'})
+            return
+
+        serializer = MoveSerializer(data=content, context={'game': game})
+        if not serializer.is_valid():
+            self.send_json({'type': 'error', 'errors': serializer.errors})
+            return
+
+        try:
+            changed = game.play(action, serializer.validated_data.get('x'), serializer.validated_data.get('y'))
+        except Game.DoesNotExist:
+            forget_game(self.pk)
+            self.close()
+            return
+        except (ValueError, MoveConflict) as error:
+            forget_game(self.pk)
+            self.send_json({'type': 'error', 'status': str(error)})
+            return
+        store_game(game)
+        publish_move(game, changed, self.channel_layer)
+
+    def game_delta(self, event):
+        # Already encoded once for every socket on the game by publish_move
+        self.send(text_data=event['text'])
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# Pragmas run on every new SQLite connection for each SQLITE_MODE
+SQLITE_MODES = {
+    # Rollback journal, the SQLite default. Readers stop a move from being saved until they finish, and every commit
+    # waits for the disk more than once
+    'rollback': ['PRAGMA journal_mode=DELETE', 'PRAGMA synchronous=FULL'],
+    # Write ahead log. Readers never block a move being saved or each other, only writers wait for each other.
+    # With synchronous=NORMAL commits only wait for the disk when the log is copied back into the database, a power
+    # cut can lose the last few moves but never corrupts the database.
+    'wal': ['PRAGMA journal_mode=WAL', 'PRAGMA synchronous=NORMAL'],
+}
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            for pragma in SQLITE_MODES[settings.SQLITE_MODE]:
+                cursor.execute(pragma)
@@ -0,0 +1,105 @@
+import json
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.exceptions import StopConsumer
+from channels.generic.http import AsyncHttpConsumer
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from game.metrics import timed
+from game.models.game import Game
+from game.renderers import GameJSONRenderer
+from game.serializers import GameSerializer, GameDeltaSerializer
+
+
+def game_group(pk):
+    return 'game-{}'.format(pk)
+
+
+def encode_event(event, version, data):
+    """
+    Writes one Server-Sent Event, the version is its id so clients can tell which moves they have seen
+    :param data: JSON text
+    :return: bytes to send as is on the stream
+    """
+    return 'id: {}\nevent: {}\ndata: {}\n\n'.format(version, event, data).encode('utf-8')
+
+
+def move_event(game, changed):
+    """
+    The message sent to a game's group after a move. The tiles the move changed are encoded once for websockets and
+    once as a Server-Sent Event, so each socket or stream only has to write out text it is given.
+    """
+    delta = dict(GameDeltaSerializer(game, context={'tiles': changed}).data)
+    return {
+        'type': 'game.delta',
+        'version': game.version,
+        'finished': not game.in_progress,
+        'text': json.dumps({'type': 'delta', 'delta': delta}),
+        'frame': encode_event('delta', game.version, json.dumps(delta, separators=(',', ':'))),
+    }
+
+
+def publish_move(game, changed, channel_layer=None):
+    """
+    Sends the tiles a move changed to every websocket and event stream open on the game.
+    An in-memory layer only reaches sockets in this process, so when none are open on the game, as in every WSGI worker,
+    the move is neither encoded nor sent.
+    """
+    channel_layer = channel_layer or get_channel_layer()
+    group = game_group(game.pk)
+    if isinstance(channel_layer, InMemoryChannelLayer) and not channel_layer.groups.get(group):
+        return
+    with timed('publish'):
+        async_to_sync(channel_layer.group_send)(group, move_event(game, changed))
+
+
+class GameEventsConsumer(AsyncHttpConsumer):
+    """
+    Streams a game to spectators as Server-Sent Events.
+    The stream starts with a game event holding the whole game, then has a delta event with the tiles each move changed,
+    and ends after the move that finishes the game. Event ids are the game's version.
+    """
+
+    async def http_request(self, message):
+        # The response stays open after the request, so this replaces AsyncHttpConsumer.http_request which ends it
+        self.pk = self.scope['url_route']['kwargs']['pk']
+        # Join before loading the game so no move is missed, moves the snapshot already has are skipped
+        await self.channel_layer.group_add(game_group(self.pk), self.channel_name)
+        snapshot = await self.snapshot()
+        if snapshot is None:
+            await self.send_response(404, b'Not found.', headers=[(b'Content-Type', b'text/plain')])
+            await self.finish()
+
+        self.version, finished, frame = snapshot
+        await self.send_headers(headers=[
+            (b'Content-Type', b'text/event-stream'),
+            (b'Cache-Control', b'no-cache'),
+            # Stops nginx holding events back until its buffer fills
+            (b'X-Accel-Buffering', b'no'),
+        ])
+        await self.send_body(frame, more_body=not finished)
+        if finished:
+            await self.finish()
+
+    @database_sync_to_async
+    def snapshot(self):
+        game = Game.objects.filter(pk=self.pk).first()
+        if game is None:
+            return None
+        data = GameJSONRenderer().render(GameSerializer(game).data).decode('utf-8')
+        return game.version, not game.in_progress, encode_event('game', game.version, data)
+
+    async def game_delta(self, event):
+        if event['version'] <= self.version:
+            return
+        self.version = event['version']
+        await self.send_body(event['frame'], more_body=not event['finished'])
+        if event['finished']:
+            await self.finish()
+
+    async def finish(self):
+        await self.disconnect()
+        raise StopConsumer()
+
+    async def disconnect(self):
+        await self.channel_layer.group_discard(game_group(self.pk), self.channel_name)
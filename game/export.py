@@ -0,0 +1,109 @@
+import csv
+import json
+import zlib
+
+from game.models.archive import ArchivedGame
+from game.models.game import Game
+from game.models.helpers.board import board_groups
+from game.renderers import encode_board
+
+# Columns of an exported game, board is the final board as an array of arrays of tile values like client_state
+EXPORT_FIELDS = ('id', 'width', 'height', 'bombs', 'no_guess', 'game_state', 'start_time', 'end_time', 'seconds',
+                 'move_count', 'board')
+
+# Games whose sizes are read in each query, kept under SQLite's limit of 999 parameters in a query
+EXPORT_BATCH = 500
+
+# Board tiles read in each query, a game bigger than this is read on its own
+EXPORT_TILES = 2 ** 20
+
+COLUMNS = ('pk', 'width', 'height', 'bombs', 'no_guess', 'game_state', 'start_time', 'end_time', 'move_count', 'state')
+
+
+def finished_games(batch, tiles=EXPORT_TILES):
+    """
+    Reads every finished game, then every archived game, in id order. The sizes of batch games are read at a time,
+    starting after the last id seen, then their boards are read a few games at a time, up to tiles tiles in each query.
+    So only boards of about tiles tiles are ever in memory however big the games are, and no read is held open between
+    queries. A game archived while exporting can appear twice, but is never left out.
+    :return: iterator of games, each a dict of EXPORT_FIELDS with board as JSON text
+    """
+    sources = (
+        (Game.objects.filter(game_state__in=['W', 'L']), bytes),
+        (ArchivedGame.objects.all(), zlib.decompress),
+    )
+    for queryset, decode in sources:
+        last = 0
+        while True:
+            sizes = list(queryset.filter(pk__gt=last).order_by('pk').values_list('pk', 'width', 'height')[:batch])
+            if not sizes:
+                break
+            for group in board_groups(sizes, tiles):
+                for row in queryset.filter(pk__in=group).order_by('pk').values_list(*COLUMNS):
+                    yield export_game(row, decode)
+            last = sizes[-1][0]
+
+
+def export_game(row, decode):
+    pk, width, height, bombs, no_guess, game_state, start_time, end_time, move_count, state = row
+    board = memoryview(decode(state))
+    seconds = None
+    if start_time is not None and end_time is not None:
+        seconds = (end_time - start_time).total_seconds()
+    return {
+        'id': pk,
+        'width': width,
+        'height': height,
+        'bombs': bombs,
+        'no_guess': no_guess,
+        'game_state': game_state,
+        'start_time': start_time and start_time.isoformat(),
+        'end_time': end_time and end_time.isoformat(),
+        'seconds': seconds,
+        'move_count': move_count,
+        'board': encode_board(board[y * width:(y + 1) * width] for y in range(0, height)),
+    }
+
+
+def ndjson_chunks(games):
+    """
+    One JSON object per line, the board is written in as it is instead of going through the json encoder again
+    :return: iterator of text, one chunk per game
+    """
+    for game in games:
+        board = game.pop('board')
+        yield json.dumps(game, separators=(',', ':'))[:-1] + ',"board":' + board + '}\n'
+
+
+class Lines:
+    """
+    File for csv.writer that hands back what is written instead of keeping it
+    """
+
+    def write(self, line):
+        return line
+
+
+def csv_chunks(games):
+    """
+    A header row then one row per game, the board column is JSON text
+    :return: iterator of text, one chunk per row
+    """
+    writer = csv.writer(Lines())
+    yield writer.writerow(EXPORT_FIELDS)
+    for game in games:
+        yield writer.writerow([game[field] for field in EXPORT_FIELDS])
+
+
+EXPORT_FORMATS = {
+    'ndjson': ndjson_chunks,
+    'csv': csv_chunks,
+}
+
+
+def export_games(export_format, batch=EXPORT_BATCH, tiles=EXPORT_TILES):
+    """
+    :param export_format: key of EXPORT_FORMATS
+    :return: iterator of text chunks of every finished game in the format
+    """
+    return EXPORT_FORMATS[export_format](finished_games(batch, tiles))
@@ -0,0 +1,37 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from game.models.archive import archive_finished_games, drop_unstarted_games, database_size, vacuum
+
+
+class Command(BaseCommand):
+    help = 'Archives old finished games, deletes old games that were never started and compacts the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.GAME_ARCHIVE['FINISHED_DAYS'],
+                            help='archive games that ended more than this many days ago')
+        parser.add_argument('--unstarted-days', type=int, default=settings.GAME_ARCHIVE['UNSTARTED_DAYS'],
+                            help='delete games never revealed that were created more than this many days ago')
+        parser.add_argument('--batch', type=int, default=500, help='games archived or deleted in each transaction')
+        parser.add_argument('--no-vacuum', action='store_true',
+                            help='leave the freed space in the database file, vacuuming locks it while it runs')
+        parser.add_argument('--loop', action='store_true', help='keep cleaning up until stopped')
+        parser.add_argument('--interval', type=float, default=3600, help='seconds to wait between rounds with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            self.clean_up(options)
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def clean_up(self, options):
+        before = database_size()
+        archived = archive_finished_games(options['days'], options['batch'])
+        dropped = drop_unstarted_games(options['unstarted_days'], options['batch'])
+        self.stdout.write('Archived {} finished games, deleted {} games never started'.format(archived, dropped))
+
+        if (archived or dropped) and not options['no_vacuum'] and vacuum():
+            self.stdout.write('Vacuumed the database, reclaimed {} bytes'.format(before - database_size()))
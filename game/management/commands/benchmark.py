@@ -0,0 +1,30 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from game.benchmarks import BENCHMARKS
+
+
+class Command(BaseCommand):
+    help = 'Runs the game engine and API benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help='benchmarks to run, defaults to all')
+        parser.add_argument('--json', action='store_true',
+                            help='print the results as a JSON object of benchmark to label to value, for tracking')
+
+    def handle(self, *args, **options):
+        names = options['names'] or sorted(BENCHMARKS)
+        unknown = set(names) - set(BENCHMARKS)
+        if unknown:
+            raise CommandError('Unknown benchmarks: {}'.format(', '.join(sorted(unknown))))
+
+        results = {}
+        for name in names:
+            results[name] = BENCHMARKS[name]()
+            if not options['json']:
+                for label, value in sorted(results[name].items()):
+                    self.stdout.write('{} {}: {:.3f}'.format(name, label, value))
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2, sort_keys=True))
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from game.models.game import DENSITY
+from game.models.pool import PooledBoard, BoardPoolStats, fill_board_pool
+
+
+class Command(BaseCommand):
+    help = 'Tops up the pool of boards generated ahead of time, or shows how it is being used'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', action='store_true', help='show pool sizes and hit counts instead of filling')
+        parser.add_argument('--loop', action='store_true', help='keep topping up the pool until stopped')
+        parser.add_argument('--interval', type=float, default=5, help='seconds to wait between rounds with --loop')
+        parser.add_argument('--batch', type=int, default=None,
+                            help='most boards to generate for each size every round, defaults to filling it up')
+
+    def handle(self, *args, **options):
+        if options['status']:
+            self.show_status()
+            return
+
+        while True:
+            for (width, height), generated in sorted(fill_board_pool(DENSITY, options['batch']).items()):
+                if generated:
+                    self.stdout.write('Generated {} {}x{} boards'.format(generated, width, height))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def show_status(self):
+        ready = PooledBoard.objects.values('width', 'height', 'bombs').annotate(boards=Count('id'))
+        ready = {(size['width'], size['height'], size['bombs']): size['boards'] for size in ready}
+        stats = {(size.width, size.height, size.bombs): size for size in BoardPoolStats.objects.all()}
+
+        for width, height, bombs in sorted(set(ready).union(stats)):
+            size = stats.get((width, height, bombs))
+            hits = size.hits if size else 0
+            misses = size.misses if size else 0
+            self.stdout.write('{}x{} with {} bombs: {} ready, {} hits, {} misses'.format(
+                width, height, bombs, ready.get((width, height, bombs), 0), hits, misses))
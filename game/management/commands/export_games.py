@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from game.export import EXPORT_BATCH, EXPORT_FORMATS, EXPORT_TILES, export_games
+
+
+class Command(BaseCommand):
+    help = 'Writes every finished game, archived ones included, with its final board and timings as NDJSON or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='ndjson', dest='export_format')
+        parser.add_argument('--output', help='file to write to, standard output if not given')
+        parser.add_argument('--batch', type=int, default=EXPORT_BATCH, help='games whose sizes are read in each query')
+        parser.add_argument('--tiles', type=int, default=EXPORT_TILES, help='board tiles read in each query')
+
+    def handle(self, *args, **options):
+        chunks = export_games(options['export_format'], options['batch'], options['tiles'])
+        if options['output'] is None:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+
+        with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+            for chunk in chunks:
+                output.write(chunk)
@@ -0,0 +1,99 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds of the histogram buckets, from 100µs up to 10s
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Metric:
+    """
+    A metric with a series for each combination of label values, kept in memory for this process only.
+    Rendered in the Prometheus text format.
+    """
+    type = None
+
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} {}'.format(self.name, self.type)]
+        with self.lock:
+            series = sorted((values, list(data)) for values, data in self.series.items())
+        for values, data in series:
+            lines.extend(self.render_series(values, data))
+        return lines
+
+    def label_text(self, values, **extra):
+        pairs = list(zip(self.labels, values)) + list(extra.items())
+        return '{' + ','.join('{}="{}"'.format(label, value) for label, value in pairs) + '}'
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, *values):
+        with self.lock:
+            data = self.series.setdefault(values, [0])
+            data[0] += 1
+
+    def render_series(self, values, data):
+        return ['{}{} {}'.format(self.name, self.label_text(values), data[0])]
+
+
+class Histogram(Metric):
+    """
+    Counts of observed durations falling in each of BUCKETS, with their sum
+    """
+    type = 'histogram'
+
+    def observe(self, seconds, *values):
+        bucket = bisect.bisect_left(BUCKETS, seconds)
+        with self.lock:
+            data = self.series.get(values)
+            if data is None:
+                # one count per bucket, one for longer than the last bucket, then the sum
+                data = self.series[values] = [0] * (len(BUCKETS) + 1) + [0.0]
+            data[bucket] += 1
+            data[-1] += seconds
+
+    def render_series(self, values, data):
+        lines = []
+        count = 0
+        for bound, observed in zip(BUCKETS + ('+Inf',), data[:-1]):
+            count += observed
+            lines.append('{}_bucket{} {}'.format(self.name, self.label_text(values, le=bound), count))
+        lines.append('{}_sum{} {}'.format(self.name, self.label_text(values), data[-1]))
+        lines.append('{}_count{} {}'.format(self.name, self.label_text(values), count))
+        return lines
+
+
+STAGES = Histogram('minesweeper_stage_seconds', 'Time spent in each stage of loading, playing and sending a game',
+                   ('stage',))
+REQUESTS = Histogram('minesweeper_request_seconds', 'Time spent in each game API action, not counting rendering',
+                     ('action',))
+RESPONSES = Counter('minesweeper_responses_total', 'Responses from each game API action by status code',
+                    ('action', 'status'))
+
+METRICS = (STAGES, REQUESTS, RESPONSES)
+
+
+@contextmanager
+def timed(stage):
+    """
+    Adds the time spent in the block to the stage's histogram
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGES.observe(time.perf_counter() - started, stage)
+
+
+def render_metrics():
+    return '\n'.join(line for metric in METRICS for line in metric.render()) + '\n'
@@ -0,0 +1,40 @@
+from django.db import migrations, models
+
+
+def text_to_binary(apps, schema_editor):
+    Game = apps.get_model('game', 'Game')
+    for game in Game.objects.exclude(state='').only('state').iterator():
+        board = bytes(int(tile) for tile in game.state.split(','))
+        Game.objects.filter(pk=game.pk).update(board=board)
+
+
+def binary_to_text(apps, schema_editor):
+    Game = apps.get_model('game', 'Game')
+    for game in Game.objects.only('board').iterator():
+        state = ','.join(str(tile) for tile in bytes(game.board))
+        Game.objects.filter(pk=game.pk).update(state=state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0004_auto_20190204_1530'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='board',
+            field=models.BinaryField(default=b''),
+        ),
+        migrations.RunPython(text_to_binary, binary_to_text),
+        migrations.RemoveField(
+            model_name='game',
+            name='state',
+        ),
+        migrations.RenameField(
+            model_name='game',
+            old_name='board',
+            new_name='state',
+        ),
+    ]
@@ -0,0 +1,22 @@
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0005_binary_state'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='game',
+            name='height',
+            field=models.IntegerField(default=8, validators=[django.core.validators.MaxValueValidator(1024), django.core.validators.MinValueValidator(8)]),
+        ),
+        migrations.AlterField(
+            model_name='game',
+            name='width',
+            field=models.IntegerField(default=8, validators=[django.core.validators.MaxValueValidator(1024), django.core.validators.MinValueValidator(8)]),
+        ),
+    ]
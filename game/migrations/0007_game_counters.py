@@ -0,0 +1,39 @@
+import math
+
+from django.db import migrations, models
+
+
+def count_tiles(apps, schema_editor):
+    Game = apps.get_model('game', 'Game')
+    for game in Game.objects.iterator():
+        tiles = game.width * game.height
+        board = bytes(game.state)
+        if game.game_state == 'C':
+            bombs = min(math.floor(0.15 * tiles), tiles - 1)
+            safe_remaining = tiles - bombs
+        else:
+            # bit 5 marks a bomb and bit 7 a hidden tile
+            bombs = len([tile for tile in board if tile & 0b100000])
+            safe_remaining = len([tile for tile in board if tile & 0b10100000 == 0b10000000])
+        Game.objects.filter(pk=game.pk).update(bombs=bombs, safe_remaining=safe_remaining)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0006_larger_boards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='bombs',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='safe_remaining',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_tiles, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0008_game_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BoardPoolStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('width', models.IntegerField()),
+                ('height', models.IntegerField()),
+                ('bombs', models.IntegerField()),
+                ('hits', models.IntegerField(default=0)),
+                ('misses', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PooledBoard',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('width', models.IntegerField()),
+                ('height', models.IntegerField()),
+                ('bombs', models.IntegerField()),
+                ('state', models.BinaryField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='pooledboard',
+            index=models.Index(fields=['width', 'height', 'bombs'], name='game_pooled_width_d85ece_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='boardpoolstats',
+            unique_together={('width', 'height', 'bombs')},
+        ),
+    ]
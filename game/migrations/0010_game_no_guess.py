@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0009_board_pool'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='no_guess',
+            field=models.BooleanField(default=False),
+        ),
+    ]
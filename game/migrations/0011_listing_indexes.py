@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0010_game_no_guess'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='game',
+            name='game_state',
+            field=models.CharField(choices=[('C', 'Created'), ('S', 'Started'), ('W', 'Won'), ('L', 'Lost')], db_index=True, default='C', editable=False, max_length=1),
+        ),
+        migrations.AlterField(
+            model_name='game',
+            name='start_time',
+            field=models.DateTimeField(db_index=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,59 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def snapshot_games(apps, schema_editor):
+    # Moves played before the log existed are lost, so the history of every game begins at its board now, which for
+    # games not started yet still holds their flags
+    Game = apps.get_model('game', 'Game')
+    BoardSnapshot = apps.get_model('game', 'BoardSnapshot')
+    for game in Game.objects.only('state', 'game_state', 'safe_remaining').iterator():
+        BoardSnapshot.objects.create(game_id=game.pk, number=0, state=game.state, game_state=game.game_state,
+                                     safe_remaining=game.safe_remaining)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0011_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BoardSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.IntegerField()),
+                ('state', models.BinaryField()),
+                ('game_state', models.CharField(max_length=1)),
+                ('safe_remaining', models.IntegerField()),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='game.Game')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Move',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.IntegerField()),
+                ('move', models.CharField(choices=[('reveal', 'Reveal'), ('flag', 'Flag'), ('chord', 'Chord')], max_length=6)),
+                ('x', models.IntegerField()),
+                ('y', models.IntegerField()),
+                ('time', models.DateTimeField(auto_now_add=True)),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='move_log', to='game.Game')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='move_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AlterUniqueTogether(
+            name='move',
+            unique_together={('game', 'number')},
+        ),
+        migrations.AddIndex(
+            model_name='boardsnapshot',
+            index=models.Index(fields=['game', 'number'], name='game_boards_game_id_5c2042_idx'),
+        ),
+        migrations.RunPython(snapshot_games, migrations.RunPython.noop),
+    ]
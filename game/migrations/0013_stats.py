@@ -0,0 +1,78 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Same as game.models.stats.LEADERBOARD_SIZE when this migration was written
+LEADERBOARD_SIZE = 10
+
+
+def add_finished_games(apps, schema_editor):
+    Game = apps.get_model('game', 'Game')
+    BoardStats = apps.get_model('game', 'BoardStats')
+    LeaderboardEntry = apps.get_model('game', 'LeaderboardEntry')
+
+    totals = {}
+    wins = {}
+    finished = Game.objects.filter(game_state__in=['W', 'L'], start_time__isnull=False, end_time__isnull=False) \
+        .values_list('pk', 'width', 'height', 'bombs', 'game_state', 'start_time', 'end_time')
+    for pk, width, height, bombs, game_state, start_time, end_time in finished.iterator():
+        size = (width, height, bombs)
+        won = game_state == 'W'
+        seconds = (end_time - start_time).total_seconds()
+        stats = totals.setdefault(size, BoardStats(width=width, height=height, bombs=bombs))
+        stats.games += 1
+        stats.wins += int(won)
+        stats.seconds += seconds
+        stats.win_seconds += seconds if won else 0
+        if won:
+            fastest = wins.setdefault(size, [])
+            fastest.append(LeaderboardEntry(game_id=pk, width=width, height=height, bombs=bombs, seconds=seconds,
+                                            end_time=end_time))
+            fastest.sort(key=lambda entry: entry.seconds)
+            del fastest[LEADERBOARD_SIZE:]
+
+    BoardStats.objects.bulk_create(totals.values())
+    LeaderboardEntry.objects.bulk_create([entry for fastest in wins.values() for entry in fastest])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0012_move_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BoardStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('width', models.IntegerField()),
+                ('height', models.IntegerField()),
+                ('bombs', models.IntegerField()),
+                ('games', models.IntegerField(default=0)),
+                ('wins', models.IntegerField(default=0)),
+                ('seconds', models.FloatField(default=0)),
+                ('win_seconds', models.FloatField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('width', models.IntegerField()),
+                ('height', models.IntegerField()),
+                ('bombs', models.IntegerField()),
+                ('seconds', models.FloatField()),
+                ('end_time', models.DateTimeField()),
+                ('game', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_entry', to='game.Game')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='boardstats',
+            unique_together={('width', 'height', 'bombs')},
+        ),
+        migrations.AddIndex(
+            model_name='leaderboardentry',
+            index=models.Index(fields=['width', 'height', 'bombs', 'seconds'], name='game_leader_width_275591_idx'),
+        ),
+        migrations.RunPython(add_finished_games, migrations.RunPython.noop),
+    ]
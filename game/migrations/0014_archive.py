@@ -0,0 +1,35 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0013_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedGame',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('width', models.IntegerField()),
+                ('height', models.IntegerField()),
+                ('bombs', models.IntegerField()),
+                ('no_guess', models.BooleanField(default=False)),
+                ('game_state', models.CharField(max_length=1)),
+                ('start_time', models.DateTimeField(null=True)),
+                ('end_time', models.DateTimeField(db_index=True, null=True)),
+                ('move_count', models.IntegerField()),
+                ('state', models.BinaryField()),
+                ('moves', models.BinaryField()),
+            ],
+        ),
+        # Games from before this have their creation time set to when it was added
+        migrations.AddField(
+            model_name='game',
+            name='created_time',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
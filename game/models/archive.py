@@ -0,0 +1,150 @@
+import datetime
+import struct
+import zlib
+
+from django.db import connection, models, transaction
+from django.utils import timezone
+from game.models.game import Game
+from game.models.helpers.board import board_groups
+from game.models.moves import Move
+
+# How each move is packed in an archived game: which move as an index into Move.MOVES, then x and y
+MOVE_FORMAT = struct.Struct('>BHH')
+
+# Board tiles read in each query while archiving, a game bigger than this is read on its own
+ARCHIVE_TILES = 2 ** 20
+
+
+class ArchivedGame(models.Model):
+    """
+    A finished game moved out of the games table. Keeps its id, counters and times, the final board and the moves
+    played, both compressed. The final board has every bomb and number on it, so the board the moves were played on is
+    the final board with every tile hidden again.
+    """
+    id = models.IntegerField(primary_key=True)
+    width = models.IntegerField()
+    height = models.IntegerField()
+    bombs = models.IntegerField()
+    no_guess = models.BooleanField(default=False)
+    game_state = models.CharField(max_length=1)
+    start_time = models.DateTimeField(null=True)
+    end_time = models.DateTimeField(null=True, db_index=True)
+    move_count = models.IntegerField()
+    state = models.BinaryField()
+    moves = models.BinaryField()
+
+
+MOVES = [move for move, name in Move.MOVES]
+
+
+def pack_moves(moves):
+    """
+    :param moves: iterable of (move, x, y) tuples
+    :return: the moves compressed, read them back with unpack_moves
+    """
+    return zlib.compress(b''.join(MOVE_FORMAT.pack(MOVES.index(move), x, y) for move, x, y in moves))
+
+
+def unpack_moves(data):
+    return [(MOVES[move], x, y) for move, x, y in MOVE_FORMAT.iter_unpack(zlib.decompress(data))]
+
+
+def archive_finished_games(days, batch):
+    """
+    Archives games that ended more than days ago. Games on a leaderboard are kept so it can still link to them.
+    :return: number of games archived
+    """
+    cutoff = timezone.now() - datetime.timedelta(days=days)
+    return archive_games(Game.objects.filter(game_state__in=['W', 'L'], end_time__lt=cutoff,
+                                             leaderboard_entry__isnull=True), batch)
+
+
+def drop_unstarted_games(days, batch):
+    """
+    Deletes games created more than days ago that never had a reveal, their boards are all hidden so nothing is lost
+    :return: number of games deleted
+    """
+    cutoff = timezone.now() - datetime.timedelta(days=days)
+    return drop_games(Game.objects.filter(game_state='C', created_time__lt=cutoff), batch)
+
+
+def archive_games(games, batch, tiles=ARCHIVE_TILES):
+    """
+    Moves games into the archive and deletes them with their move log, batch games at a time.
+    Each batch is its own transaction, so moves on other games are only ever held up for one batch. The boards of a
+    batch are read a few games at a time, up to tiles tiles in each query, so big boards are never all in memory at
+    once.
+    :param games: queryset of finished games
+    :return: number of games archived
+    """
+    archived = 0
+    while True:
+        with transaction.atomic():
+            sizes = list(games.values_list('pk', 'width', 'height')[:batch])
+            if not sizes:
+                return archived
+            for ids in board_groups(sizes, tiles):
+                archive_group(games.filter(pk__in=ids))
+            archived += len(sizes)
+
+
+def archive_group(games):
+    rows = list(games.values_list('pk', 'width', 'height', 'bombs', 'no_guess', 'game_state', 'start_time', 'end_time',
+                                  'move_count', 'state'))
+    ids = [row[0] for row in rows]
+    moves = {}
+    for game, move, x, y in Move.objects.filter(game__in=ids).order_by('game', 'number') \
+            .values_list('game', 'move', 'x', 'y'):
+        moves.setdefault(game, []).append((move, x, y))
+
+    ArchivedGame.objects.bulk_create(
+        ArchivedGame(id=pk, width=width, height=height, bombs=bombs, no_guess=no_guess, game_state=game_state,
+                     start_time=start_time, end_time=end_time, move_count=move_count,
+                     state=zlib.compress(bytes(state)), moves=pack_moves(moves.get(pk, [])))
+        for pk, width, height, bombs, no_guess, game_state, start_time, end_time, move_count, state in rows)
+    delete_games(Game.objects.filter(pk__in=ids))
+
+
+def drop_games(games, batch):
+    """
+    Deletes games batch games at a time, each batch in its own transaction
+    :return: number of games deleted
+    """
+    dropped = 0
+    while True:
+        with transaction.atomic():
+            ids = list(games.values_list('pk', flat=True)[:batch])
+            if not ids:
+                return dropped
+            delete_games(Game.objects.filter(pk__in=ids))
+            dropped += len(ids)
+
+
+def delete_games(games):
+    # Only the primary key is needed to delete, so boards are never loaded
+    games.only('pk').delete()
+
+
+def database_size():
+    """
+    :return: bytes used by the database file, or None on databases other than SQLite
+    """
+    if connection.vendor != 'sqlite':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA page_count')
+        pages = cursor.fetchone()[0]
+        cursor.execute('PRAGMA page_size')
+        return pages * cursor.fetchone()[0]
+
+
+def vacuum():
+    """
+    Rebuilds the SQLite database file so the space freed by deleted rows is given back, other databases are left alone
+    :return: True if the database was vacuumed
+    """
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('VACUUM')
+    return True
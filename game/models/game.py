@@ -1,144 +1,32 @@
-import math
-import random
-import datetime
-
-from django.db import models
+import numpy
+from django.db import models, transaction
+from django.db.models import F
 from django.core.validators import MaxValueValidator, MinValueValidator
-from game.models.helpers.bitwise_operations import is_hidden, is_flagged, is_bomb, set_hidden, set_flagged, set_bomb
-from django.db.models.signals import pre_save
+from django.utils import timezone
+from game.models.helpers.bitwise_operations import is_hidden, is_flagged, is_bomb, set_hidden, set_flagged
+from game.models.helpers.board import extract_adjacent, tile_index, tile_coordinates, neighbours, CLIENT_TABLE, \
+    bomb_count, generate_game, generate_empty_game, propagate_unhide, serialize_game, deserialize_game
+from game.metrics import timed
+from game.models.helpers.solver import generate_no_guess_game
+from game.models.moves import Move, BoardSnapshot, SNAPSHOT_INTERVAL
+from game.models.pool import take_pooled_board
+from game.models.stats import record_game_end
+from django.db.models.signals import pre_save, post_save
 from django.dispatch import receiver
 
+# Largest width or height of a board, at one byte per tile the largest board takes 1MiB
+MAX_DIMENSION = 1024
+# Fraction of tiles that are bombs
+DENSITY = 0.15
+# Times a move is tried without holding the game, before the game is held until the move is saved
+MOVE_ATTEMPTS = 10
 
-def extract_adjacent(tile):
-    return tile & 0b1111
-
-
-def set_adjacent(value, tile=0):
-    if value > 0b1111:
-        raise ValueError("tile being set must be a maximum of 4 bits")
-    return (value & 0b1111) + (tile & (~0b1111))
-
-
-def create_tile(hidden, flagged, bomb, number=0):
-    return set_hidden(hidden) + set_flagged(flagged) + set_bomb(bomb) + (number & 0b1111)
-
-
-def mask_hidden_data(tile):
-    hidden = is_hidden(tile)
-    flagged = is_flagged(tile)
-    bomb = is_bomb(tile)
-    adjacent = extract_adjacent(tile)
-
-    if hidden:
-        return create_tile(hidden, flagged, False, False)
-    else:
-        return create_tile(hidden, False, bomb, adjacent)
-
-
-def count_hidden(grid):
-    count = 0
-    for row in grid:
-        for tile in row:
-            if is_hidden(tile):
-                count += 1
-
-    return count
-
-
-def generate_game(grid, width, height, clicked_x, clicked_y, density=0.15):
-    tiles_total = width * height
-    tiles_remaining = tiles_total
-    bombs_remaining = math.floor(density * width * height) - 1
-
-    # Place bombs on the grid
-    for y in range(0, height):
-        row = []
-        for x in range(0, width):
-            tile = grid[y][x]
-            if not (y == clicked_y and x == clicked_x):
-                bomb = False
-                if random.uniform(0, 1) < bombs_remaining / tiles_remaining:
-                    bomb = True
-                grid[y][x] = create_tile(True, is_flagged(tile), bomb)
-                if bomb:
-                    bombs_remaining -= 1
-                tiles_remaining -= 1
-            else:
-                grid[y][x] = create_tile(True, False, False)
-        grid.append(row)
-
-    # Count bombs adjacent to each square
-    for y in range(0, height):
-        for x in range(0, width):
-            tile = grid[y][x]
-            bomb = is_bomb(tile)
-            if not bomb:
-                count = 0
-                for y_offset in range(-1, 2):
-                    y_probe = y + y_offset
-                    if 0 <= y_probe < height:
-                        for x_offset in range(-1, 2):
-                            x_probe = x + x_offset
-                            if 0 <= x_probe < width:
-                                if is_bomb(grid[y_probe][x_probe]):
-                                    count += 1
-                grid[y][x] = set_adjacent(count, tile)
-
-    return grid
-
-
-def generate_empty_game(width, height):
-    grid = []
-
-    # Place bombs on the grid
-    for y in range(0, height):
-        row = []
-        for x in range(0, width):
-            row.append(create_tile(True, False, False))
-        grid.append(row)
 
-    return grid
-
-
-def propagate_unhide(grid, width, height):
-    modified = 0
-    for y in range(0, height):
-        for x in range(0, width):
-            tile = grid[y][x]
-            if not is_hidden(tile) and not is_bomb(tile) and extract_adjacent(tile) == 0:
-                for y_offset in range(-1, 2):
-                    y_probe = y + y_offset
-                    if 0 <= y_probe < height:
-                        for x_offset in range(-1, 2):
-                            x_probe = x + x_offset
-                            if 0 <= x_probe < width:
-                                tile_probe = grid[y_probe][x_probe]
-                                if is_hidden(tile_probe):
-                                    grid[y_probe][x_probe] = set_hidden(False, tile_probe)
-                                    modified += 1
-
-    if modified > 0:
-        return propagate_unhide(grid, width, height)
-    return grid
-
-
-def serialize_game(grid):
-    return ','.join([str(item) for sublist in grid for item in sublist])
-
-
-def deserialize_game(string, width, height):
-    flat_tiles = [int(tile) for tile in string.split(',')][::-1]
-
-    client_state = []
-
-    # x is horizontal, y is vertical, top left is 0, 0
-    for y in range(0, height):
-        row = []
-        for x in range(0, width):
-            row.append(flat_tiles.pop())
-        client_state.append(row)
-
-    return client_state
+class MoveConflict(Exception):
+    """
+    Raised when a move could not be saved because other moves on the same game kept being saved first
+    """
+    pass
 
 
 class Game(models.Model):
@@ -148,81 +36,336 @@ class Game(models.Model):
         ('W', 'Won'),
         ('L', 'Lost'),
     )
-    game_state = models.CharField(max_length=1, editable=False, choices=GAME_STATES, default='C')
-    start_time = models.DateTimeField(null=True, editable=False)
+    game_state = models.CharField(max_length=1, editable=False, choices=GAME_STATES, default='C', db_index=True)
+    created_time = models.DateTimeField(auto_now_add=True, db_index=True)
+    start_time = models.DateTimeField(null=True, editable=False, db_index=True)
     end_time = models.DateTimeField(null=True, editable=False)
-    # 255 is the largest number a tile can have
-    # comma separated values means 4 chars per tile.
-    # (This could be cut down to 2 chars with hex, at the cost of complexity)
-    # 32 is the max field size, 32 * 32 * 4 = 4096
-    state = models.CharField(default="",
-                             editable=False,
-                             max_length=4096)
+    # 255 is the largest number a tile can have, so every tile is stored as a single byte, row by row.
+    # Only written when the game is created and when it ends, moves in between only add to the move log. The board of a
+    # game in progress is rebuilt from its latest snapshot and the moves after it when the game is loaded, see from_db
+    state = models.BinaryField(default=b'')
+    # Counters kept up to date by each move, so reading them never needs the board
+    bombs = models.IntegerField(default=0, editable=False)
+    safe_remaining = models.IntegerField(default=0, editable=False)
+    # Generate a board that can be solved without guessing, starting from an opening on the first reveal
+    no_guess = models.BooleanField(default=False)
+    # Goes up by one with every saved move, moves are only saved if nothing else was saved since the game was loaded
+    version = models.IntegerField(default=0, editable=False)
+    # Number of moves played, the number of the latest move in the move log
+    move_count = models.IntegerField(default=0, editable=False)
     height = models.IntegerField(default=8,
                                  validators=[
-                                     MaxValueValidator(32),
+                                     MaxValueValidator(MAX_DIMENSION),
                                      MinValueValidator(8)
                                  ])
     width = models.IntegerField(default=8,
                                 validators=[
-                                    MaxValueValidator(32),
+                                    MaxValueValidator(MAX_DIMENSION),
                                     MinValueValidator(8)
                                 ])
 
+    # Fields each move can change, the only ones written back when the move is saved. The board is left out, it is only
+    # written once the game is over
+    MOVE_FIELDS = {
+        'reveal': ('game_state', 'start_time', 'end_time', 'safe_remaining', 'no_guess'),
+        'flag': (),
+        'chord': ('game_state', 'end_time', 'safe_remaining'),
+    }
+
+    # Every field a move can change, kept to put the game back as it was when its moves could not be saved
+    PLAYED_FIELDS = ('state', 'game_state', 'start_time', 'end_time', 'safe_remaining', 'no_guess', 'move_count')
+
+    @classmethod
+    def from_db(cls, db, field_names, values, rebuild_board=True):
+        """
+        Loads a game, rebuilding the board of a game in progress from the move log as the row only has the board it was
+        created with
+        :param rebuild_board: pass False for values that already hold the latest board, such as a cached game
+        """
+        game = super().from_db(db, field_names, values)
+        loaded = {'state', 'game_state', 'move_count'}.issubset(field_names)
+        if rebuild_board and loaded and game.in_progress and game.move_count:
+            with timed('rebuild_board'):
+                game.state = game.replay(game.move_count).state
+        return game
+
+    @property
+    def in_progress(self):
+        return self.game_state == 'S' or self.game_state == 'C'
+
+    def play(self, move, x, y):
+        """
+        Applies a single move and saves it, see play_moves
+        :return: list of indices changed by the move
+        """
+        changed, applied = self.play_moves([(move, x, y)])
+        return changed
+
+    def play_moves(self, moves):
+        """
+        Applies moves and saves them, safe against other moves on the same game being saved at the same time.
+        The save only goes through if the version is unchanged since the game was loaded, otherwise the game catches up
+        with the other moves and the moves are applied again on top of them. If other moves keep being saved first the
+        last attempt holds the game, so other moves wait for this one to be saved.
+        The moves are inserted into the move log and only the counters they changed are updated on the game, the board
+        is written as well once the game is over.
+        :param moves: list of (move, x, y) tuples, move is a key of MOVE_FIELDS
+        :return: list of indices changed by the moves, number of moves applied
+        """
+        fields = {'move_count'}
+        for move, x, y in moves:
+            fields.update(self.MOVE_FIELDS[move])
+
+        for attempt in range(0, MOVE_ATTEMPTS - 1):
+            before = {field: getattr(self, field) for field in self.PLAYED_FIELDS}
+            changed, applied = self.apply_moves(moves)
+            with timed('commit'), transaction.atomic():
+                if self.commit(fields if self.in_progress else fields | {'state'}):
+                    self.save_log()
+                    return changed, applied
+            self.unsaved_log()[:] = ([], [])
+            for field, value in before.items():
+                setattr(self, field, value)
+            self.catch_up()
+
+        with timed('commit'), transaction.atomic():
+            # Writing the row locks it until the transaction ends, a no-op write is enough
+            Game.objects.filter(pk=self.pk).update(version=F('version'))
+            self.catch_up()
+            changed, applied = self.apply_moves(moves)
+            if self.commit(fields if self.in_progress else fields | {'state'}):
+                self.save_log()
+                return changed, applied
+
+        raise MoveConflict('Game was changed by {} other moves while saving'.format(MOVE_ATTEMPTS))
+
+    def commit(self, fields):
+        """
+        Saves only the given fields, as long as nothing else was saved since this game was loaded
+        :return: True if the fields were saved, False if the game had already been changed
+        """
+        values = {field: getattr(self, field) for field in fields}
+        updated = Game.objects.filter(pk=self.pk, version=self.version).update(version=self.version + 1, **values)
+        if updated:
+            self.version += 1
+        return updated == 1
+
+    def catch_up(self):
+        """
+        Brings a game in progress up to date with the moves saved since it was loaded, by applying them from the move
+        log instead of reloading and rebuilding the board. Games that were generated or ended since are reloaded, those
+        boards cannot be worked out from the moves.
+        """
+        latest = Game.objects.filter(pk=self.pk).values('version', 'game_state', 'move_count').first()
+        if latest is None or not self.in_progress or latest['game_state'] != self.game_state:
+            self.refresh_from_db()
+            return
+
+        moves = list(self.move_log.filter(number__gt=self.move_count, number__lte=latest['move_count'])
+                     .order_by('number').values_list('move', 'x', 'y'))
+        if len(moves) != latest['move_count'] - self.move_count:
+            self.refresh_from_db()
+            return
+        if moves:
+            self.apply_moves(moves)
+            # Already in the move log, the worker that played them saved them
+            self.unsaved_log()[:] = ([], [])
+        self.version = latest['version']
+
+    def apply_moves(self, moves):
+        """
+        Applies moves in order to a single decoded copy of the board, stopping early if one of them ends the game.
+        If a move is invalid a ValueError is raised and the game should be thrown away, as it may be half updated.
+        :param moves: iterable of (move, x, y) tuples, move is a key of MOVE_FIELDS
+        :return: list of indices changed by the moves, number of moves applied
+        """
+        if not self.in_progress:
+            raise ValueError('Cannot update completed game')
+
+        with timed('deserialize_game'):
+            grid = deserialize_game(self.state, self.width, self.height)
+        logged, snapshots = self.unsaved_log()
+        changed = []
+        applied = 0
+        for move, x, y in moves:
+            if not self.in_progress:
+                break
+            generated = self.game_state == 'C'
+            changed.extend(getattr(self, '_' + move)(grid, x, y))
+            applied += 1
+            self.move_count += 1
+            logged.append(Move(number=self.move_count, move=move, x=x, y=y))
+            # Boards are random, so the board after the move that generated it is kept for replaying the moves after it
+            generated = generated and self.game_state != 'C'
+            if generated or self.move_count % SNAPSHOT_INTERVAL == 0:
+                snapshots.append(self.snapshot(grid))
+
+        with timed('serialize_game'):
+            self.state = serialize_game(grid)
+        return changed, applied
+
+    def unsaved_log(self):
+        """
+        Moves and snapshots applied since the game was last saved, they are written to the move log with the game
+        :return: list of unsaved moves, list of unsaved snapshots
+        """
+        if not hasattr(self, '_unsaved_log'):
+            self._unsaved_log = [[], []]
+        return self._unsaved_log
+
+    def save_log(self):
+        """
+        Writes the unsaved moves and snapshots to the move log, each with a single insert.
+        No moves are played after the one that ends a game, so if the game is over these moves ended it.
+        """
+        logged, snapshots = self.unsaved_log()
+        for row in logged + snapshots:
+            row.game_id = self.pk
+        Move.objects.bulk_create(logged)
+        BoardSnapshot.objects.bulk_create(snapshots)
+        self.unsaved_log()[:] = ([], [])
+
+        if logged and not self.in_progress:
+            record_game_end(self)
+
+    def snapshot(self, grid):
+        return BoardSnapshot(number=self.move_count, state=serialize_game(grid), game_state=self.game_state,
+                             safe_remaining=self.safe_remaining)
+
+    def replay(self, number):
+        """
+        Rebuilds the game as it was after the given number of moves, from the latest snapshot before then and the moves
+        played after it
+        :return: unsaved copy of the game
+        :raises ValueError: if the game has not had that many moves
+        """
+        if not 0 <= number <= self.move_count:
+            raise ValueError('Game has {} moves'.format(self.move_count))
+
+        game = Game(pk=self.pk, width=self.width, height=self.height, bombs=self.bombs, no_guess=self.no_guess,
+                    state=serialize_game(generate_empty_game(self.width, self.height)),
+                    safe_remaining=self.width * self.height - self.bombs)
+        snapshot = self.snapshots.filter(number__lte=number).order_by('-number', '-id').first()
+        if snapshot is not None:
+            game.state = bytes(snapshot.state)
+            game.game_state = snapshot.game_state
+            game.safe_remaining = snapshot.safe_remaining
+            game.move_count = snapshot.number
+
+        moves = list(self.move_log.filter(number__gt=game.move_count, number__lte=number).order_by('number')
+                     .values_list('move', 'x', 'y'))
+        if len(moves) != number - game.move_count:
+            raise ValueError('Move log of the game is incomplete')
+        if game.game_state == 'C' and any(move != 'flag' for move, x, y in moves):
+            raise ValueError('Generated board of the game was not kept')
+        if moves:
+            game.apply_moves(moves)
+
+        if game.game_state != 'C':
+            game.start_time = self.start_time
+        if not game.in_progress:
+            game.end_time = self.end_time
+        return game
+
     def reveal(self, x, y):
-        grid = deserialize_game(self.state, self.width, self.height)
+        """
+        Reveals the tile at x, y, generating the board first if this is the opening move
+        :return: list of indices of every tile that was revealed
+        """
+        changed, applied = self.apply_moves([('reveal', x, y)])
+        return changed
+
+    def chord(self, x, y):
+        """
+        Reveals every unflagged tile around the revealed number at x, y, if it has as many flags around it as its number
+        :return: list of indices of every tile that was revealed
+        """
+        changed, applied = self.apply_moves([('chord', x, y)])
+        return changed
+
+    def flag(self, x, y):
+        """
+        Toggles the flag on the tile at x, y
+        :return: list holding the index of the flagged tile
+        """
+        changed, applied = self.apply_moves([('flag', x, y)])
+        return changed
 
+    def _reveal(self, grid, x, y):
         if self.game_state == "C":
-            grid = generate_game(grid, self.width, self.height, x, y, 0.15)
-            self.start_time = datetime.datetime.utcnow()
+            with timed('generate'):
+                if self.no_guess:
+                    attempts, solvable = generate_no_guess_game(grid, self.width, self.height, x, y, DENSITY)
+                    # The board kept may need a guess, so the game no longer claims it does not
+                    self.no_guess = solvable
+                elif not take_pooled_board(grid, self.width, self.height, self.bombs, x, y):
+                    generate_game(grid, self.width, self.height, x, y, DENSITY)
+            self.start_time = timezone.now()
             self.game_state = "S"
 
-        tile = grid[y][x]
-        bomb = is_bomb(tile)
-        hidden = is_hidden(tile)
-
-        if not hidden:
+        if not is_hidden(grid[tile_index(x, y, self.width)]):
             raise ValueError('Cannot reveal a tile that is not hidden')
-        grid[y][x] = set_hidden(False, tile)
-        grid = propagate_unhide(grid, self.width, self.height)
-        self.state = serialize_game(grid)
+
+        return self._uncover(grid, x, y)
+
+    def _chord(self, grid, x, y):
+        index = tile_index(x, y, self.width)
+        tile = grid[index]
+
+        if is_hidden(tile):
+            raise ValueError('Cannot chord a tile that is hidden')
+        around = neighbours(index, self.width, self.height)
+        if len([probe for probe in around if is_flagged(grid[probe])]) != extract_adjacent(tile):
+            raise ValueError('Number of flags around the tile does not match its number')
+
+        revealed = []
+        for probe in around:
+            if not self.in_progress:
+                break
+            tile_probe = grid[probe]
+            if is_hidden(tile_probe) and not is_flagged(tile_probe):
+                revealed.extend(self._uncover(grid, *tile_coordinates(probe, self.width)))
+
+        return revealed
+
+    def _uncover(self, grid, x, y):
+        bomb = is_bomb(grid[tile_index(x, y, self.width)])
+        with timed('propagate_unhide'):
+            revealed = propagate_unhide(grid, self.width, self.height, x, y)
 
         if bomb:
             self.game_state = 'L'
-            self.end_time = datetime.datetime.utcnow()
+            self.end_time = timezone.now()
         else:
-            if count_hidden(grid) == self.bombs:
+            self.safe_remaining -= len(revealed)
+            if self.safe_remaining == 0:
                 self.game_state = 'W'
-                self.end_time = datetime.datetime.utcnow()
+                self.end_time = timezone.now()
 
-    def flag(self, x, y):
-        grid = deserialize_game(self.state, self.width, self.height)
-        tile = grid[y][x]
+        return revealed
+
+    def _flag(self, grid, x, y):
+        index = tile_index(x, y, self.width)
+        tile = grid[index]
         hidden = is_hidden(tile)
         flagged = is_flagged(tile)
 
         if not hidden:
             raise ValueError('Cannot flag a tile that is not hidden')
-        grid[y][x] = set_flagged(not flagged, tile)
-        self.state = serialize_game(grid)
+        grid[index] = set_flagged(not flagged, tile)
+
+        return [index]
 
     @property
-    def bombs(self):
+    def client_board(self):
         """
-        Returns a representation of the state that is scrubbed of information that the client does not need to know
-        :return: array of arrays, first index is vertical, second is horizontal, values are tile values
+        Returns the flat board scrubbed of information that the client does not need to know
+        :return: bytes, one per tile, index it with tile_index
         """
-        # removing from the end of a list is easier / faster in python, so we reverse the list then pop
-
-        flat_tiles = [int(tile) for tile in self.state.split(',')]
-        count = 0
-
-        # x is horizontal, y is vertical, top left is 0, 0
-        for tile in flat_tiles:
-            if is_bomb(tile):
-                count += 1
-
-        return count
+        board = bytes(self.state)
+        if self.game_state == 'W' or self.game_state == 'L':
+            return board
+        return board.translate(CLIENT_TABLE)
 
     @property
     def client_state(self):
@@ -230,31 +373,43 @@ class Game(models.Model):
         Returns a representation of the state that is scrubbed of information that the client does not need to know
         :return: array of arrays, first index is vertical, second is horizontal, values are tile values
         """
-        # removing from the end of a list is easier / faster in python, so we reverse the list then pop
-
-        flat_tiles = [int(tile) for tile in self.state.split(',')][::-1]
-
         width = self.width
-        height = self.height
-
-        client_state = []
-
-        mask_hidden = not (self.game_state == 'W' or self.game_state == 'L')
+        board = memoryview(self.client_board)
 
         # x is horizontal, y is vertical, top left is 0, 0
-        for y in range(0, height):
-            row = []
-            for x in range(0, width):
-                if mask_hidden:
-                    row.append(mask_hidden_data(flat_tiles.pop()))
-                else:
-                    row.append(flat_tiles.pop())
-            client_state.append(row)
+        return [list(board[y * width:(y + 1) * width]) for y in range(0, self.height)]
+
+    def client_tiles(self, indices):
+        """
+        Returns the client representation of only the given tiles, for sending what a move changed instead of the board.
+        Once the game is over hidden tiles are no longer scrubbed, so all of them are included as well.
+        :param indices: indices of the tiles that changed, may contain duplicates
+        :return: list of [x, y, value] lists, in board order
+        """
+        board = bytes(self.state)
+        indices = set(indices)
+        if self.game_state == 'W' or self.game_state == 'L':
+            hidden = numpy.flatnonzero(numpy.frombuffer(board, dtype=numpy.uint8) & set_hidden(True))
+            indices.update(hidden.tolist())
+        else:
+            board = board.translate(CLIENT_TABLE)
+        indices = sorted(indices)
 
-        return client_state
+        width = self.width
+        return [[index % width, index // width, board[index]] for index in indices]
 
 
 @receiver(pre_save, sender=Game)
 def my_callback(sender, instance, *args, **kwargs):
-    if instance.state == "":
+    # Any save is a change moves loaded before it have to be replayed on top of, see Game.play_moves
+    instance.version += 1
+    if not instance.state:
         instance.state = serialize_game(generate_empty_game(instance.width, instance.height))
+        instance.bombs = bomb_count(instance.width, instance.height, DENSITY)
+        instance.safe_remaining = instance.width * instance.height - instance.bombs
+
+
+@receiver(post_save, sender=Game)
+def save_move_log(sender, instance, *args, **kwargs):
+    # Moves applied without play_moves are logged when the game is saved
+    instance.save_log()
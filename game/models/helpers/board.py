@@ -0,0 +1,209 @@
+import math
+from collections import deque
+
+import numpy
+from game.models.helpers.bitwise_operations import is_hidden, is_flagged, is_bomb, set_hidden, set_flagged, set_bomb
+
+
+def extract_adjacent(tile):
+    return tile & 0b1111
+
+
+def set_adjacent(value, tile=0):
+    if value > 0b1111:
+        raise ValueError("tile being set must be a maximum of 4 bits")
+    return (value & 0b1111) + (tile & (~0b1111))
+
+
+def create_tile(hidden, flagged, bomb, number=0):
+    return set_hidden(hidden) + set_flagged(flagged) + set_bomb(bomb) + (number & 0b1111)
+
+
+def mask_hidden_data(tile):
+    hidden = is_hidden(tile)
+    flagged = is_flagged(tile)
+    bomb = is_bomb(tile)
+    adjacent = extract_adjacent(tile)
+
+    if hidden:
+        return create_tile(hidden, flagged, False, False)
+    else:
+        return create_tile(hidden, False, bomb, adjacent)
+
+
+def tile_index(x, y, width):
+    """
+    Boards are stored flat, row by row
+    :return: index of the tile at x, y in the flat board
+    """
+    return y * width + x
+
+
+def tile_coordinates(index, width):
+    """
+    :return: x, y tuple of the tile at index in the flat board
+    """
+    return index % width, index // width
+
+
+def neighbours(index, width, height):
+    """
+    :return: list of indices of the up to 8 tiles surrounding index, not including index itself
+    """
+    x, y = tile_coordinates(index, width)
+    indices = []
+    for y_probe in range(max(y - 1, 0), min(y + 2, height)):
+        row_start = y_probe * width
+        for x_probe in range(max(x - 1, 0), min(x + 2, width)):
+            if x_probe != x or y_probe != y:
+                indices.append(row_start + x_probe)
+    return indices
+
+
+# Lookup tables for bytes.translate, so whole board scans run in C instead of a python loop per tile.
+# The counting tables map each tile value to 1 if it matches and 0 if it does not.
+HIDDEN_TABLE = bytes(int(is_hidden(tile)) for tile in range(256))
+BOMB_TABLE = bytes(int(is_bomb(tile)) for tile in range(256))
+CLIENT_TABLE = bytes(mask_hidden_data(tile) for tile in range(256))
+
+
+def count_hidden(grid):
+    return grid.translate(HIDDEN_TABLE).count(1)
+
+
+def count_bombs(grid):
+    return grid.translate(BOMB_TABLE).count(1)
+
+
+def bomb_count(width, height, density):
+    """
+    :return: number of bombs to place on a board, always leaving at least the first clicked tile free
+    """
+    return min(math.floor(density * width * height), width * height - 1)
+
+
+def generate_game(grid, width, height, clicked_x, clicked_y, density=0.15, seed=None, opening=False):
+    """
+    Places bombs anywhere but the clicked tile, then counts the bombs adjacent to each tile.
+    The board is expected to be freshly created, holding nothing but hidden and flagged tiles, and flags are kept.
+    :param seed: seed for the random number generator, pass one to get the same board every time
+    :param opening: also keep the tiles around the clicked one free, so the first reveal always opens up an area
+    """
+    random_state = numpy.random.RandomState(seed)
+    clicked = tile_index(clicked_x, clicked_y, width)
+    free = sorted(neighbours(clicked, width, height) + [clicked]) if opening else [clicked]
+    bombs = min(bomb_count(width, height, density), width * height - len(free))
+
+    # Sample from every index but the free ones, then shift the sampled indices up past each free one to skip it
+    bomb_indices = random_state.choice(width * height - len(free), bombs, replace=False)
+    for index in free:
+        bomb_indices[bomb_indices >= index] += 1
+
+    bombs = numpy.zeros(width * height, dtype=numpy.uint8)
+    bombs[bomb_indices] = 1
+    bombs = bombs.reshape(height, width)
+
+    # Count bombs adjacent to each square by adding up the board shifted in each of the 8 directions
+    padded = numpy.pad(bombs, 1, mode='constant')
+    adjacent = numpy.zeros((height, width), dtype=numpy.uint8)
+    for y_offset in range(0, 3):
+        for x_offset in range(0, 3):
+            if not (y_offset == 1 and x_offset == 1):
+                adjacent += padded[y_offset:y_offset + height, x_offset:x_offset + width]
+
+    board = numpy.frombuffer(grid, dtype=numpy.uint8).reshape(height, width)
+    board |= numpy.where(bombs, numpy.uint8(set_bomb(True)), adjacent)
+
+    return grid
+
+
+def generate_empty_game(width, height):
+    return bytearray([create_tile(True, False, False)]) * (width * height)
+
+
+def propagate_unhide(grid, width, height, x, y):
+    """
+    Reveals the tile at x, y and flood fills outwards from it through tiles with no adjacent bombs.
+    Every tile is visited at most once, so the cost scales with the size of the opened area rather than the board.
+    :return: list of indices of every tile that was revealed, in the order they were revealed
+    """
+    index = tile_index(x, y, width)
+    tile = grid[index]
+    if not is_hidden(tile):
+        return []
+
+    grid[index] = set_hidden(False, tile)
+    revealed = [index]
+    queue = deque(revealed)
+
+    while queue:
+        index = queue.popleft()
+        tile = grid[index]
+        if is_bomb(tile) or extract_adjacent(tile) != 0:
+            continue
+        for probe in neighbours(index, width, height):
+            tile_probe = grid[probe]
+            if is_hidden(tile_probe):
+                grid[probe] = set_hidden(False, tile_probe)
+                revealed.append(probe)
+                queue.append(probe)
+
+    return revealed
+
+
+def serialize_game(grid):
+    """
+    Boards are stored as one byte per tile, row by row
+    :return: bytes of length width * height
+    """
+    return bytes(grid)
+
+
+def deserialize_game(data, width, height):
+    """
+    :return: mutable flat board, index it with tile_index
+    """
+    grid = bytearray(data)
+    if len(grid) != width * height:
+        raise ValueError('Board does not match its dimensions')
+    return grid
+
+
+def move_bomb(grid, width, height, source, target):
+    """
+    Moves the bomb at source to the empty tile at target, updating the adjacent counts around both
+    """
+    grid[source] = set_bomb(False, grid[source])
+    for probe in neighbours(source, width, height):
+        tile = grid[probe]
+        if not is_bomb(tile):
+            grid[probe] = set_adjacent(extract_adjacent(tile) - 1, tile)
+
+    grid[target] = set_adjacent(0, set_bomb(True, grid[target]))
+    for probe in neighbours(target, width, height):
+        tile = grid[probe]
+        if not is_bomb(tile):
+            grid[probe] = set_adjacent(extract_adjacent(tile) + 1, tile)
+
+    bombs = len([probe for probe in neighbours(source, width, height) if is_bomb(grid[probe])])
+    grid[source] = set_adjacent(bombs, grid[source])
+    return grid
+
+
+def board_groups(sizes, tiles):
+    """
+    Splits games into runs whose boards add up to at most tiles tiles, or a single game when it is bigger
+    :param sizes: list of (pk, width, height)
+    :return: iterator of lists of pks
+    """
+    group = []
+    total = 0
+    for pk, width, height in sizes:
+        if group and total + width * height > tiles:
+            yield group
+            group = []
+            total = 0
+        group.append(pk)
+        total += width * height
+    if group:
+        yield group
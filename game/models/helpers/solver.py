@@ -0,0 +1,316 @@
+from collections import defaultdict
+
+import numpy
+from game.models.helpers.bitwise_operations import is_hidden, set_hidden
+from game.models.helpers.board import extract_adjacent, neighbours, tile_coordinates, CLIENT_TABLE, \
+    count_bombs, generate_game, propagate_unhide
+
+# Boards generated before giving up on finding one that can be solved without guessing
+NO_GUESS_ATTEMPTS = 100
+# Largest group of connected unknown tiles whose bomb layouts are all counted, bigger groups get an estimate
+MAX_COMPONENT_TILES = 20
+
+
+def binomial(n, k):
+    if k < 0 or k > n:
+        return 0
+    result = 1
+    for i in range(0, min(k, n - k)):
+        result = result * (n - i) // (i + 1)
+    return result
+
+
+def components(constraints):
+    """
+    Splits constraints into groups that share no unknown tiles, each can be solved on its own
+    :return: list of (set of tiles, list of constraints) tuples
+    """
+    groups = []
+    by_tile = {}
+    for constraint in constraints:
+        merged = {id(by_tile[index]): by_tile[index] for index in constraint[0] if index in by_tile}.values()
+        group = (set(constraint[0]), [constraint])
+        for other in merged:
+            group[0].update(other[0])
+            group[1].extend(other[1])
+            groups.remove(other)
+        groups.append(group)
+        for index in group[0]:
+            by_tile[index] = group
+    return groups
+
+
+def count_layouts(tiles, constraints):
+    """
+    Counts every placement of bombs on the tiles that satisfies all of the constraints
+    :return: dict of number of bombs placed to (number of layouts, dict of tile to number of layouts it is a bomb in)
+    """
+    by_tile = defaultdict(list)
+    remaining = []
+    unassigned = []
+    for number, (unknown, bombs) in enumerate(constraints):
+        remaining.append(bombs)
+        unassigned.append(len(unknown))
+        for index in unknown:
+            by_tile[index].append(number)
+
+    order = sorted(tiles)
+    layouts = {}
+    placed = []
+
+    def place(position):
+        if position == len(order):
+            layout = layouts.setdefault(len(placed), [0, defaultdict(int)])
+            layout[0] += 1
+            for index in placed:
+                layout[1][index] += 1
+            return
+
+        index = order[position]
+        for bomb in (1, 0):
+            valid = True
+            for number in by_tile[index]:
+                remaining[number] -= bomb
+                unassigned[number] -= 1
+                if remaining[number] < 0 or remaining[number] > unassigned[number]:
+                    valid = False
+            if valid:
+                if bomb:
+                    placed.append(index)
+                place(position + 1)
+                if bomb:
+                    placed.pop()
+            for number in by_tile[index]:
+                remaining[number] += bomb
+                unassigned[number] += 1
+
+    place(0)
+    return {bombs: (total, dict(counts)) for bombs, (total, counts) in layouts.items()}
+
+
+class Solver:
+    """
+    Deduces which hidden tiles are certainly safe and which are certainly bombs, from only what a player can see.
+    Tiles can be revealed as play goes on, only revealed numbers next to hidden tiles are looked at when solving.
+    """
+
+    def __init__(self, board, width, height, bombs):
+        """
+        :param board: board as the client sees it, with hidden tiles scrubbed by mask_hidden_data
+        :param bombs: number of bombs on the board
+        """
+        self.board = bytearray(board)
+        self.width = width
+        self.height = height
+        self.bombs = bombs
+        self.mines = set()
+        self.safe = set()
+
+        tiles = numpy.frombuffer(bytes(self.board), dtype=numpy.uint8)
+        hidden = tiles & set_hidden(True) != 0
+        self.hidden = set(numpy.flatnonzero(hidden).tolist())
+        self.frontier = set(numpy.flatnonzero(~hidden & (tiles & 0b1111 > 0)).tolist())
+
+    def reveal(self, index, tile):
+        """
+        Records a tile the player has revealed
+        :param tile: client value of the tile
+        """
+        self.board[index] = tile
+        self.hidden.discard(index)
+        self.safe.discard(index)
+        if extract_adjacent(tile) > 0:
+            self.frontier.add(index)
+
+    def constraints(self):
+        """
+        Every revealed number next to hidden tiles says how many of those tiles are bombs
+        :return: set of (frozenset of unknown tile indices, number of bombs among them) tuples
+        """
+        constraints = set()
+        for index in list(self.frontier):
+            unknown = []
+            remaining = extract_adjacent(self.board[index])
+            for probe in neighbours(index, self.width, self.height):
+                if probe in self.mines:
+                    remaining -= 1
+                elif is_hidden(self.board[probe]) and probe not in self.safe:
+                    unknown.append(probe)
+            if unknown:
+                constraints.add((frozenset(unknown), remaining))
+            else:
+                self.frontier.discard(index)
+        return constraints
+
+    def solve(self):
+        """
+        Applies single point reasoning to each number, then subset reasoning between overlapping numbers, then the
+        total bomb count, until nothing more can be deduced
+        :return: set of hidden tiles that are safe, set of tiles that are bombs
+        """
+        while self.deduce():
+            pass
+        return set(self.safe), set(self.mines)
+
+    def deduce(self):
+        constraints = self.constraints()
+        safe = set()
+        mines = set()
+
+        for unknown, remaining in constraints:
+            if remaining == 0:
+                safe.update(unknown)
+            elif remaining == len(unknown):
+                mines.update(unknown)
+
+        if not safe and not mines:
+            by_tile = defaultdict(list)
+            for constraint in constraints:
+                for index in constraint[0]:
+                    by_tile[index].append(constraint)
+
+            # A number whose unknown tiles are all next to another number tells us about the rest of the other's
+            for unknown, remaining in constraints:
+                for other, other_remaining in by_tile[next(iter(unknown))]:
+                    if unknown < other:
+                        difference = other - unknown
+                        if other_remaining == remaining:
+                            safe.update(difference)
+                        elif other_remaining - remaining == len(difference):
+                            mines.update(difference)
+
+        if not safe and not mines:
+            unknown = self.hidden - self.safe - self.mines
+            if unknown and len(self.mines) == self.bombs:
+                safe.update(unknown)
+            elif unknown and len(unknown) == self.bombs - len(self.mines):
+                mines.update(unknown)
+
+        self.safe.update(safe)
+        self.mines.update(mines)
+        return bool(safe or mines)
+
+    def probabilities(self):
+        """
+        Chance of each unknown tile next to a revealed number being a bomb, given every layout of bombs that agrees
+        with the numbers and the total bomb count is equally likely. Each group of connected tiles is counted on its
+        own, groups larger than MAX_COMPONENT_TILES are estimated from their numbers alone.
+        :return: dict of tile index to probability, probability for each unknown tile not next to any number
+        """
+        groups = []
+        probabilities = {}
+        for tiles, group in components(self.constraints()):
+            if len(tiles) <= MAX_COMPONENT_TILES:
+                groups.append(count_layouts(tiles, group))
+            for index in tiles:
+                probabilities[index] = 0
+            if len(tiles) > MAX_COMPONENT_TILES:
+                for unknown, bombs in group:
+                    for index in unknown:
+                        probabilities[index] = max(probabilities[index], bombs / len(unknown))
+
+        others = len(self.hidden - self.safe - self.mines - set(probabilities))
+        estimated = [index for index in probabilities if probabilities[index] > 0]
+        bombs_left = self.bombs - len(self.mines) - int(round(sum(probabilities[index] for index in estimated)))
+
+        def combine(layouts):
+            """
+            :return: dict of bombs placed across all the groups to the number of ways of placing them
+            """
+            ways = {0: 1}
+            for group in layouts:
+                combined = defaultdict(int)
+                for placed, count in ways.items():
+                    for bombs, (total, counts) in group.items():
+                        combined[placed + bombs] += count * total
+                ways = combined
+            return ways
+
+        def weight(ways, placed_elsewhere=0):
+            """
+            :return: number of layouts of the whole board, counting every way of placing the bombs left over
+            """
+            return sum(count * binomial(others, bombs_left - placed - placed_elsewhere)
+                       for placed, count in ways.items())
+
+        ways = combine(groups)
+        total = weight(ways)
+        if total == 0:
+            return probabilities, (bombs_left / others if others else 0)
+
+        for number, group in enumerate(groups):
+            rest = combine(groups[:number] + groups[number + 1:])
+            for bombs, (count, counts) in group.items():
+                share = weight(rest, bombs)
+                for index, layouts in counts.items():
+                    probabilities[index] += layouts * share / total
+
+        other_bombs = sum(count * binomial(others, bombs_left - placed) * (bombs_left - placed)
+                          for placed, count in ways.items())
+        return probabilities, (other_bombs / total / others if others else 0)
+
+
+def hint(board, width, height, bombs):
+    """
+    Works out the best next moves from only what the player can see
+    :param board: board as the client sees it, with hidden tiles scrubbed by mask_hidden_data
+    :return: dict of tiles that are certainly safe and certainly bombs, as [x, y] lists. When no tile is certainly
+    safe it also has the chance of each tile next to a number being a bomb, as [x, y, probability] lists safest first,
+    and the chance for any other hidden tile.
+    """
+    solver = Solver(board, width, height, bombs)
+    safe, mines = solver.solve()
+    result = {
+        'safe': [list(tile_coordinates(index, width)) for index in sorted(safe)],
+        'mines': [list(tile_coordinates(index, width)) for index in sorted(mines)],
+    }
+
+    if not safe:
+        probabilities, others = solver.probabilities()
+        result['probabilities'] = [list(tile_coordinates(index, width)) + [round(probability, 4)]
+                                   for index, probability in sorted(probabilities.items(), key=lambda item: item[1])]
+        result['others'] = round(others, 4)
+
+    return result
+
+
+def is_solvable(grid, width, height, x, y, bombs):
+    """
+    Plays the board from the first reveal at x, y, only ever revealing tiles the solver proves are safe
+    :param grid: generated board, it is not changed
+    :return: True if every safe tile can be revealed without guessing
+    """
+    grid = bytearray(grid)
+    revealed = propagate_unhide(grid, width, height, x, y)
+    solver = Solver(bytes(grid).translate(CLIENT_TABLE), width, height, bombs)
+    safe_remaining = width * height - bombs - len(revealed)
+
+    while safe_remaining > 0:
+        safe, mines = solver.solve()
+        if not safe:
+            return False
+        for index in safe:
+            for probe in propagate_unhide(grid, width, height, *tile_coordinates(index, width)):
+                solver.reveal(probe, CLIENT_TABLE[grid[probe]])
+                safe_remaining -= 1
+
+    return True
+
+
+def generate_no_guess_game(grid, width, height, clicked_x, clicked_y, density=0.15, seed=None):
+    """
+    Generates boards like generate_game, with the first reveal always opening an area, until one can be solved
+    without guessing. If none is found within NO_GUESS_ATTEMPTS the last board is kept.
+    :param seed: seed for the random number generator, pass one to get the same board every time
+    :return: number of boards generated, whether the board kept can be solved without guessing
+    """
+    empty = bytes(grid)
+    random_state = numpy.random.RandomState(seed)
+
+    for attempt in range(1, NO_GUESS_ATTEMPTS + 1):
+        grid[:] = empty
+        generate_game(grid, width, height, clicked_x, clicked_y, density, random_state.randint(2 ** 31), opening=True)
+        if is_solvable(grid, width, height, clicked_x, clicked_y, count_bombs(grid)):
+            return attempt, True
+
+    return NO_GUESS_ATTEMPTS, False
@@ -0,0 +1,42 @@
+from django.db import models
+
+# Moves between snapshots of the board, replaying a game never applies more moves than this on top of a snapshot
+SNAPSHOT_INTERVAL = 100
+
+
+class Move(models.Model):
+    """
+    A move played on a game. Moves are only ever added, numbered from 1 in the order they were played.
+    """
+    MOVES = (
+        ('reveal', 'Reveal'),
+        ('flag', 'Flag'),
+        ('chord', 'Chord'),
+    )
+    game = models.ForeignKey('game.Game', on_delete=models.CASCADE, related_name='move_log')
+    number = models.IntegerField()
+    move = models.CharField(max_length=6, choices=MOVES)
+    x = models.IntegerField()
+    y = models.IntegerField()
+    time = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('game', 'number')
+
+
+class BoardSnapshot(models.Model):
+    """
+    The board of a game after a number of moves, taken after the reveal that generates the board and every
+    SNAPSHOT_INTERVAL moves. Moves before the generating reveal are replayed from an empty board, or from the board the
+    game had when the move log was added.
+    """
+    game = models.ForeignKey('game.Game', on_delete=models.CASCADE, related_name='snapshots')
+    number = models.IntegerField()
+    state = models.BinaryField()
+    game_state = models.CharField(max_length=1)
+    safe_remaining = models.IntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['game', 'number']),
+        ]
@@ -0,0 +1,109 @@
+import numpy
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from game.models.helpers.bitwise_operations import is_bomb, set_bomb, set_flagged
+from game.models.helpers.board import tile_index, bomb_count, generate_game, generate_empty_game, move_bomb
+
+
+class PooledBoard(models.Model):
+    """
+    A board generated ahead of time, waiting for the first reveal of a game the same size.
+    Each board leaves a random tile free, so every tile is as likely to be a bomb, see take_pooled_board
+    """
+    width = models.IntegerField()
+    height = models.IntegerField()
+    bombs = models.IntegerField()
+    state = models.BinaryField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['width', 'height', 'bombs']),
+        ]
+
+
+class BoardPoolStats(models.Model):
+    """
+    How often the first reveal of a game found a board in the pool, for each pooled size
+    """
+    width = models.IntegerField()
+    height = models.IntegerField()
+    bombs = models.IntegerField()
+    hits = models.IntegerField(default=0)
+    misses = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('width', 'height', 'bombs')
+
+
+def pooled_sizes():
+    return [tuple(size) for size in settings.GAME_BOARD_POOL['SIZES']]
+
+
+def fill_board_pool(density, limit=None):
+    """
+    Tops up the pool for every pooled size to GAME_BOARD_POOL['TARGET'] boards
+    :param limit: most boards to generate for each size, to spread filling the pool out over time
+    :return: dict of (width, height) to the number of boards generated
+    """
+    generated = {}
+    for width, height in pooled_sizes():
+        bombs = bomb_count(width, height, density)
+        missing = settings.GAME_BOARD_POOL['TARGET'] - PooledBoard.objects.filter(
+            width=width, height=height, bombs=bombs).count()
+        if limit is not None:
+            missing = min(missing, limit)
+
+        boards = []
+        for board in range(0, missing):
+            free = numpy.random.randint(width * height)
+            grid = generate_game(generate_empty_game(width, height), width, height, free % width, free // width,
+                                 density)
+            boards.append(PooledBoard(width=width, height=height, bombs=bombs, state=bytes(grid)))
+        PooledBoard.objects.bulk_create(boards)
+        generated[(width, height)] = len(boards)
+
+    return generated
+
+
+def take_pooled_board(grid, width, height, bombs, x, y):
+    """
+    Replaces a freshly created grid with a board from the pool, keeping its flags.
+    If x, y is a bomb it is moved to a random tile without one, like classic minesweeper does.
+    :return: True if a board was taken, False if the pool had none and one has to be generated
+    """
+    if (width, height) not in pooled_sizes():
+        return False
+
+    # Another game can take the same board between reading and deleting it, then try the next one
+    for attempt in range(0, 3):
+        pooled = PooledBoard.objects.filter(width=width, height=height, bombs=bombs).values_list('pk', 'state').first()
+        if pooled is None:
+            break
+        pk, state = pooled
+        deleted, rows = PooledBoard.objects.filter(pk=pk).delete()
+        if deleted:
+            board = bytearray(state)
+            clicked = tile_index(x, y, width)
+            if is_bomb(board[clicked]):
+                free = numpy.flatnonzero((numpy.frombuffer(board, dtype=numpy.uint8) & set_bomb(True)) == 0)
+                move_bomb(board, width, height, clicked, int(numpy.random.choice(free)))
+            flags = numpy.frombuffer(grid, dtype=numpy.uint8) & set_flagged(True)
+            grid[:] = (numpy.frombuffer(board, dtype=numpy.uint8) | flags).tobytes()
+            record_pool_use(width, height, bombs, 'hits')
+            return True
+
+    record_pool_use(width, height, bombs, 'misses')
+    return False
+
+
+def record_pool_use(width, height, bombs, counter):
+    stats = BoardPoolStats.objects.filter(width=width, height=height, bombs=bombs)
+    if stats.update(**{counter: F(counter) + 1}):
+        return
+    try:
+        with transaction.atomic():
+            BoardPoolStats.objects.create(width=width, height=height, bombs=bombs, **{counter: 1})
+    except IntegrityError:
+        # Another worker created the row between the update and the insert
+        stats.update(**{counter: F(counter) + 1})
@@ -0,0 +1,131 @@
+from django.core.cache import cache
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+
+# Fastest wins kept for each board size, slower wins are never stored
+LEADERBOARD_SIZE = 10
+# Seconds leaderboards and stats are cached for, they are also dropped from the cache whenever they change
+STATS_CACHE_SECONDS = 60
+STATS_KEY = 'stats'
+
+
+class BoardStats(models.Model):
+    """
+    Totals over every finished game of one board size and bomb count, added to as each game ends
+    """
+    width = models.IntegerField()
+    height = models.IntegerField()
+    bombs = models.IntegerField()
+    games = models.IntegerField(default=0)
+    wins = models.IntegerField(default=0)
+    seconds = models.FloatField(default=0)
+    win_seconds = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = ('width', 'height', 'bombs')
+
+
+class LeaderboardEntry(models.Model):
+    """
+    One of the LEADERBOARD_SIZE fastest wins for a board size and bomb count
+    """
+    game = models.OneToOneField('game.Game', on_delete=models.CASCADE, related_name='leaderboard_entry')
+    width = models.IntegerField()
+    height = models.IntegerField()
+    bombs = models.IntegerField()
+    seconds = models.FloatField()
+    end_time = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['width', 'height', 'bombs', 'seconds']),
+        ]
+
+
+def leaderboard_key(width, height, bombs):
+    return 'leaderboard:{}:{}:{}'.format(width, height, bombs)
+
+
+def record_game_end(game):
+    """
+    Adds a game that just ended to the totals for its size, and to the leaderboard if it was one of the fastest wins
+    """
+    won = game.game_state == 'W'
+    seconds = (game.end_time - game.start_time).total_seconds()
+    increments = {
+        'games': F('games') + 1,
+        'wins': F('wins') + int(won),
+        'seconds': F('seconds') + seconds,
+        'win_seconds': F('win_seconds') + (seconds if won else 0),
+    }
+    stats = BoardStats.objects.filter(width=game.width, height=game.height, bombs=game.bombs)
+    if not stats.update(**increments):
+        try:
+            with transaction.atomic():
+                BoardStats.objects.create(width=game.width, height=game.height, bombs=game.bombs, games=1,
+                                          wins=int(won), seconds=seconds, win_seconds=seconds if won else 0)
+        except IntegrityError:
+            # Another worker created the row between the update and the insert
+            stats.update(**increments)
+    cache.delete(STATS_KEY)
+
+    if won:
+        add_to_leaderboard(game, seconds)
+
+
+def add_to_leaderboard(game, seconds):
+    """
+    Adds a win to the leaderboard for its size if it is fast enough, then drops whatever no longer fits
+    """
+    entries = LeaderboardEntry.objects.filter(width=game.width, height=game.height, bombs=game.bombs) \
+        .order_by('seconds', 'id')
+    slowest = entries.values_list('seconds', flat=True)[LEADERBOARD_SIZE - 1:LEADERBOARD_SIZE]
+    if slowest and seconds >= slowest[0]:
+        return
+
+    LeaderboardEntry.objects.create(game_id=game.pk, width=game.width, height=game.height, bombs=game.bombs,
+                                    seconds=seconds, end_time=game.end_time)
+    dropped = list(entries.values_list('pk', flat=True)[LEADERBOARD_SIZE:])
+    if dropped:
+        LeaderboardEntry.objects.filter(pk__in=dropped).delete()
+    cache.delete(leaderboard_key(game.width, game.height, game.bombs))
+
+
+def leaderboard(width, height, bombs):
+    """
+    :return: list of the fastest wins for the size, fastest first, as dicts of game, seconds and end_time
+    """
+    key = leaderboard_key(width, height, bombs)
+    entries = cache.get(key)
+    if entries is None:
+        entries = list(LeaderboardEntry.objects.filter(width=width, height=height, bombs=bombs)
+                       .order_by('seconds', 'id').values('game', 'seconds', 'end_time')[:LEADERBOARD_SIZE])
+        cache.set(key, entries, STATS_CACHE_SECONDS)
+    return entries
+
+
+def game_stats():
+    """
+    :return: dict of totals over every finished game, and the same for each board size
+    """
+    stats = cache.get(STATS_KEY)
+    if stats is None:
+        rows = list(BoardStats.objects.order_by('width', 'height', 'bombs'))
+        sizes = [summarise(row.games, row.wins, row.seconds, row.win_seconds, width=row.width, height=row.height,
+                           bombs=row.bombs) for row in rows]
+        stats = summarise(sum(row.games for row in rows), sum(row.wins for row in rows),
+                          sum(row.seconds for row in rows), sum(row.win_seconds for row in rows), sizes=sizes)
+        cache.set(STATS_KEY, stats, STATS_CACHE_SECONDS)
+    return stats
+
+
+def summarise(games, wins, seconds, win_seconds, **extra):
+    summary = {
+        'games': games,
+        'wins': wins,
+        'win_rate': wins / games if games else None,
+        'average_seconds': seconds / games if games else None,
+        'average_win_seconds': win_seconds / wins if wins else None,
+    }
+    summary.update(extra)
+    return summary
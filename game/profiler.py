@@ -0,0 +1,69 @@
+import collections
+import os
+import sys
+import threading
+import time
+
+from django.conf import settings
+
+# The running sampler, when GAME_PROFILER_INTERVAL is set
+SAMPLER = None
+
+
+class StackSampler:
+    """
+    Looks at the stack of every other thread every interval seconds and counts how often each stack is seen.
+    Threads are never paused or traced, so the only cost is the sampling thread itself.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.counts = collections.Counter()
+        self.lock = threading.Lock()
+
+    def start(self):
+        threading.Thread(target=self.run, name='stack-sampler', daemon=True).start()
+
+    def run(self):
+        own = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            self.sample(own)
+
+    def sample(self, skip=None):
+        stacks = []
+        for ident, frame in sys._current_frames().items():
+            if ident == skip:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append('{} ({})'.format(frame.f_code.co_name, os.path.basename(frame.f_code.co_filename)))
+                frame = frame.f_back
+            stacks.append(';'.join(reversed(stack)))
+
+        with self.lock:
+            self.counts.update(stacks)
+
+    def collapsed(self):
+        """
+        :return: one line per stack, outermost call first, followed by the number of times it was seen. This is the
+        collapsed format flamegraph.pl and speedscope read.
+        """
+        with self.lock:
+            counts = sorted(self.counts.items())
+        return ''.join('{} {}\n'.format(stack, count) for stack, count in counts)
+
+
+def start_on_request(sender, **kwargs):
+    """
+    Starts the sampler when the process serves its first request, commands that only load the app never start it
+    """
+    start_sampler(settings.GAME_PROFILER_INTERVAL)
+
+
+def start_sampler(interval):
+    global SAMPLER
+    if SAMPLER is None:
+        SAMPLER = StackSampler(interval)
+        SAMPLER.start()
+    return SAMPLER
@@ -0,0 +1,99 @@
+import base64
+import csv
+import io
+import json
+
+from game.metrics import timed
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+# JSON text of every value a tile can have, so boards are written without going through the json encoder
+TILE_JSON = [str(tile) for tile in range(256)]
+
+
+def encode_board(rows):
+    """
+    Writes a board as JSON, the same as json.dumps with compact separators
+    :param rows: array of arrays of tile values, as returned by Game.client_state
+    :return: JSON text
+    """
+    return '[[' + '],['.join(','.join(map(TILE_JSON.__getitem__, row)) for row in rows) + ']]'
+
+
+class GameJSONRenderer(JSONRenderer):
+    """
+    JSON renderer that writes client_state with a lookup table instead of the json encoder, boards are most of a game
+    and the encoder is slow at long lists of small numbers. Indented output is left to the normal renderer, with the
+    board as board_value gives it.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timed('render'):
+            return self.render_game(data, accepted_media_type, renderer_context)
+
+    def render_game(self, data, accepted_media_type, renderer_context):
+        if not isinstance(data, dict) or 'client_state' not in data:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        data = dict(data)
+        rows = data.pop('client_state')
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None or not self.compact:
+            data['client_state'] = self.board_value(rows)
+            return super().render(data, accepted_media_type, renderer_context)
+
+        board = self.render_board(rows)
+        rendered = super().render(data, accepted_media_type, renderer_context)
+        separator = b',' if data else b''
+        return rendered[:-1] + separator + b'"client_state":' + board + b'}'
+
+    def board_value(self, rows):
+        return rows
+
+    def render_board(self, rows):
+        return encode_board(rows).encode('ascii')
+
+
+class Base64BoardRenderer(GameJSONRenderer):
+    """
+    JSON with client_state sent as base64 of one byte per tile row by row, a third of the size of the array of arrays.
+    Asked for with an Accept header of application/vnd.minesweeper.base64+json or ?format=base64.
+    """
+    media_type = 'application/vnd.minesweeper.base64+json'
+    format = 'base64'
+
+    def board_value(self, rows):
+        return base64.b64encode(b''.join(map(bytes, rows))).decode('ascii')
+
+    def render_board(self, rows):
+        return b'"' + self.board_value(rows).encode('ascii') + b'"'
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    One JSON object per line. Exports stream their own lines, this renders anything else such as errors.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        rows = data if isinstance(data, list) else [data]
+        return ''.join(json.dumps(row) + '\n' for row in rows).encode('utf-8')
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    A header row of the keys of the first object, then a row per object.
+    Exports stream their own rows, this renders anything else such as errors.
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        rows = data if isinstance(data, list) else [data]
+        out = io.StringIO()
+        if rows:
+            writer = csv.DictWriter(out, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+        return out.getvalue().encode('utf-8')
@@ -1,4 +1,4 @@
-from game.models.game import Game
+from game.models.game import Game, MAX_DIMENSION
 from rest_framework import serializers
 from django.core.validators import MaxValueValidator, MinValueValidator
 from rest_framework.permissions import IsAdminUser, AllowAny
@@ -7,13 +7,25 @@ from rest_framework.permissions import IsAdminUser, AllowAny
 class GameSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = Game
-        fields = ('id', 'height', 'width', 'start_time', 'end_time', 'client_state', 'game_state', 'bombs')
+        fields = ('id', 'height', 'width', 'no_guess', 'start_time', 'end_time', 'client_state', 'game_state', 'bombs',
+                  'safe_remaining', 'move_count')
+
+
+class GameSummarySerializer(serializers.HyperlinkedModelSerializer):
+    """
+    A game without its board, for listings
+    """
+    class Meta:
+        model = Game
+        fields = ('id', 'height', 'width', 'no_guess', 'start_time', 'end_time', 'game_state', 'bombs',
+                  'safe_remaining', 'move_count')
 
 
 class GameSerializerWithReadOnlyDimensions(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = Game
-        fields = ('id', 'height', 'width', 'start_time', 'end_time', 'client_state', 'game_state', 'bombs')
+        fields = ('id', 'height', 'width', 'no_guess', 'start_time', 'end_time', 'client_state', 'game_state', 'bombs',
+                  'safe_remaining', 'move_count')
     width = serializers.IntegerField(
         read_only=True,
         default=serializers.CreateOnlyDefault(8)
@@ -22,14 +34,62 @@ class GameSerializerWithReadOnlyDimensions(serializers.HyperlinkedModelSerialize
         read_only=True,
         default=serializers.CreateOnlyDefault(8)
     )
+    no_guess = serializers.BooleanField(read_only=True)
+
+
+class GameDeltaSerializer(serializers.HyperlinkedModelSerializer):
+    """
+    A game with only the tiles a move changed, pass their indices as tiles in the serializer context
+    """
+    class Meta:
+        model = Game
+        fields = ('id', 'start_time', 'end_time', 'game_state', 'bombs', 'safe_remaining', 'move_count', 'tiles')
+    tiles = serializers.SerializerMethodField()
+
+    def get_tiles(self, game):
+        return game.client_tiles(self.context['tiles'])
 
 
 class MoveSerializer(serializers.Serializer):
+    """
+    A move on a tile of the game passed in the serializer context
+    """
     x = serializers.IntegerField(validators=[
-        MaxValueValidator(32),
         MinValueValidator(0)
     ])
     y = serializers.IntegerField(validators=[
-        MaxValueValidator(32),
         MinValueValidator(0)
     ])
+
+    def validate(self, data):
+        game = self.context['game']
+        if data['x'] >= game.width or data['y'] >= game.height:
+            raise serializers.ValidationError('Move is outside of the board')
+        return data
+
+
+class BatchMoveSerializer(MoveSerializer):
+    move = serializers.ChoiceField(choices=sorted(Game.MOVE_FIELDS))
+
+
+class BatchSerializer(serializers.Serializer):
+    """
+    An ordered list of moves to apply to the game passed in the serializer context
+    """
+    MAX_MOVES = 1000
+
+    moves = BatchMoveSerializer(many=True, allow_empty=False)
+
+    def validate_moves(self, moves):
+        if len(moves) > self.MAX_MOVES:
+            raise serializers.ValidationError('At most {} moves can be sent at once'.format(self.MAX_MOVES))
+        return moves
+
+
+class LeaderboardSerializer(serializers.Serializer):
+    """
+    A board size to show the leaderboard of, bombs defaults to the number every new game of that size has
+    """
+    width = serializers.IntegerField(validators=[MinValueValidator(8), MaxValueValidator(MAX_DIMENSION)])
+    height = serializers.IntegerField(validators=[MinValueValidator(8), MaxValueValidator(MAX_DIMENSION)])
+    bombs = serializers.IntegerField(required=False, validators=[MinValueValidator(0)])
@@ -1,5 +1,43 @@
-from django.test import TestCase
-from game.models.game import Game
+import base64
+import csv
+import datetime
+import io
+import importlib
+import json
+import threading
+import zlib
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.testing import HttpCommunicator, WebsocketCommunicator
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.signals import request_started
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F, QuerySet
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from game.benchmarks import BENCHMARKS, bench_api, bench_sqlite_writes, bench_spectators, bench_export
+from game.cache import GAME_CACHE, load_game, store_game
+from game.metrics import Histogram
+from game import profiler
+from game.profiler import StackSampler
+from game.models.game import Game, DENSITY
+from game.models.helpers.solver import Solver, is_solvable, generate_no_guess_game, hint
+from game.renderers import GameJSONRenderer, Base64BoardRenderer, encode_board
+from game.serializers import GameSerializer
+from game.models.stats import BoardStats, LeaderboardEntry, record_game_end, leaderboard
+from game.models.archive import ArchivedGame, archive_finished_games, archive_games, unpack_moves
+from game.export import export_games
+from game.models.moves import Move
+from game.models.pool import PooledBoard, BoardPoolStats, fill_board_pool, take_pooled_board, record_pool_use
+from game.models.helpers.board import create_tile, propagate_unhide, serialize_game, deserialize_game, \
+    generate_empty_game, generate_game, count_bombs, count_hidden, tile_index, tile_coordinates, neighbours, \
+    extract_adjacent, move_bomb, board_groups
+from minesweeperserver.routing import application
 from game.models.helpers.bitwise_operations import is_hidden, is_flagged, is_bomb, set_hidden, set_flagged, set_bomb
 
 
@@ -66,3 +104,1016 @@ class GameTestCase(TestCase):
                 tiles += 1
 
         self.assertEqual(tiles, 64)
+
+    def test_counters_track_reveals(self):
+        game = Game.objects.get(id=1)
+        self.assertEqual(game.safe_remaining, 55)
+        game.reveal(0, 0)
+        self.assertEqual(game.safe_remaining, count_hidden(game.state) - count_bombs(game.state))
+
+        for index, tile in enumerate(game.state):
+            if is_hidden(tile) and not is_bomb(tile) and is_hidden(game.state[index]):
+                game.reveal(*tile_coordinates(index, game.width))
+
+        self.assertEqual(game.safe_remaining, 0)
+        self.assertEqual(game.game_state, 'W')
+
+
+class TestSerialization(TestCase):
+    def test_one_byte_per_tile(self):
+        grid = bytearray([128, 1, 33, 0, 255, 192])
+        data = serialize_game(grid)
+        self.assertEqual(data, bytes([128, 1, 33, 0, 255, 192]))
+        self.assertEqual(deserialize_game(data, 3, 2), grid)
+
+    def test_dimensions_must_match(self):
+        with self.assertRaises(ValueError):
+            deserialize_game(bytes(6), 2, 2)
+
+
+class TestPropagateUnhide(TestCase):
+    def setUp(self):
+        # bomb in the bottom right corner of a 4x4 board, everything else is reachable from the top left
+        self.grid = generate_empty_game(4, 4)
+        self.grid[15] = create_tile(True, False, True)
+        self.grid[10] = create_tile(True, False, False, 1)
+        self.grid[11] = create_tile(True, False, False, 1)
+        self.grid[14] = create_tile(True, False, False, 1)
+
+    def test_reveals_opening(self):
+        revealed = propagate_unhide(self.grid, 4, 4, 0, 0)
+        self.assertEqual(revealed[0], 0)
+        self.assertEqual(sorted(revealed), list(range(0, 15)))
+        self.assertEqual(self.grid[15], create_tile(True, False, True))
+
+    def test_number_stops_propagation(self):
+        revealed = propagate_unhide(self.grid, 4, 4, 2, 2)
+        self.assertEqual(revealed, [10])
+        self.assertEqual(propagate_unhide(self.grid, 4, 4, 2, 2), [])
+
+
+class TestLargeBoards(TestCase):
+    def test_generate_large_board(self):
+        grid = generate_game(generate_empty_game(1000, 1000), 1000, 1000, 500, 500)
+        self.assertEqual(count_bombs(grid), 150000)
+        self.assertFalse(is_bomb(grid[tile_index(500, 500, 1000)]))
+
+    def test_generation_is_seedable(self):
+        first = generate_game(generate_empty_game(16, 16), 16, 16, 0, 0, seed=42)
+        second = generate_game(generate_empty_game(16, 16), 16, 16, 0, 0, seed=42)
+        self.assertEqual(first, second)
+
+    def test_flags_are_kept(self):
+        grid = generate_empty_game(8, 8)
+        grid[5] = create_tile(True, True, False)
+        grid = generate_game(grid, 8, 8, 0, 0, density=0.99, seed=1)
+        self.assertEqual(count_bombs(grid), 63)
+        self.assertEqual(grid[0], create_tile(True, False, False, 3))
+        self.assertEqual(grid[5], create_tile(True, True, True))
+
+    def test_adjacent_counts(self):
+        grid = generate_game(generate_empty_game(30, 20), 30, 20, 3, 4)
+        for index, tile in enumerate(grid):
+            if not is_bomb(tile):
+                bombs = len([probe for probe in neighbours(index, 30, 20) if is_bomb(grid[probe])])
+                self.assertEqual(extract_adjacent(tile), bombs)
+
+    def test_move_outside_board(self):
+        game = Game.objects.create(width=1000, height=1000)
+        response = self.client.post('/api/games/{}/reveal/'.format(game.id), {'x': 1000, 'y': 0})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/games/{}/flag/'.format(game.id), {'x': 999, 'y': 999})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['client_state'][999][999], 192)
+
+
+class TestDeltaResponses(TestCase):
+    def setUp(self):
+        self.game = Game.objects.create(width=16, height=16)
+
+    def test_flag_delta(self):
+        response = self.client.post('/api/games/{}/flag/?delta=true'.format(self.game.id), {'x': 3, 'y': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('client_state', response.data)
+        self.assertEqual(response.data['tiles'], [[3, 2, 192]])
+
+    def test_reveal_delta_matches_full_state(self):
+        response = self.client.post('/api/games/{}/reveal/?delta=true'.format(self.game.id), {'x': 8, 'y': 8})
+        self.assertEqual(response.status_code, 200)
+        client_state = self.client.get('/api/games/{}/'.format(self.game.id)).data['client_state']
+        self.assertIn([8, 8, client_state[8][8]], response.data['tiles'])
+        for x, y, value in response.data['tiles']:
+            self.assertEqual(client_state[y][x], value)
+            self.assertFalse(is_hidden(value))
+
+    def test_lost_game_delta_shows_bombs(self):
+        self.game.reveal(0, 0)
+        self.game.save()
+        bomb = next(index for index, tile in enumerate(self.game.state) if is_bomb(tile))
+        x, y = tile_coordinates(bomb, 16)
+        response = self.client.post('/api/games/{}/reveal/?delta=1'.format(self.game.id), {'x': x, 'y': y})
+        self.assertEqual(response.data['game_state'], 'L')
+        tiles = {(x, y): value for x, y, value in response.data['tiles']}
+        self.assertEqual(len([value for value in tiles.values() if is_bomb(value)]), self.game.bombs)
+
+
+class TestGameConsumer(TransactionTestCase):
+    def setUp(self):
+        self.game = Game.objects.create(width=16, height=16)
+
+    def connect(self):
+        return WebsocketCommunicator(application, '/ws/games/{}/'.format(self.game.id))
+
+    def test_moves_are_sent_to_every_socket(self):
+        async def play():
+            player = self.connect()
+            spectator = self.connect()
+            self.assertTrue((await player.connect())[0])
+            self.assertTrue((await spectator.connect())[0])
+            self.assertEqual((await player.receive_json_from())['game']['game_state'], 'C')
+            await spectator.receive_json_from()
+
+            await player.send_json_to({'action': 'flag', 'x': 1, 'y': 2})
+            for communicator in (player, spectator):
+                message = await communicator.receive_json_from()
+                self.assertEqual(message['type'], 'delta')
+                self.assertEqual(message['delta']['tiles'], [[1, 2, 192]])
+
+            await player.send_json_to({'action': 'reveal', 'x': 16, 'y': 0})
+            self.assertEqual((await player.receive_json_from())['type'], 'error')
+            self.assertTrue(await spectator.receive_nothing())
+
+            await player.disconnect()
+            await spectator.disconnect()
+
+        async_to_sync(play)()
+        self.assertEqual(Game.objects.get(id=self.game.id).client_state[2][1], 192)
+
+    def test_unknown_game_is_rejected(self):
+        async def connect():
+            communicator = WebsocketCommunicator(application, '/ws/games/{}/'.format(self.game.id + 1))
+            connected, _ = await communicator.connect()
+            self.assertFalse(connected)
+
+        async_to_sync(connect)()
+
+
+class TestGameEvents(TransactionTestCase):
+    def setUp(self):
+        self.game = Game.objects.create(width=16, height=16)
+
+    def events(self, pk=None):
+        return HttpCommunicator(application, 'GET', '/api/games/{}/events/'.format(pk or self.game.id))
+
+    def test_snapshot_then_moves_are_streamed(self):
+        async def watch():
+            spectators = [self.events() for _ in range(3)]
+            for spectator in spectators:
+                await spectator.send_input({'type': 'http.request'})
+                start = await spectator.receive_output()
+                self.assertEqual(start['status'], 200)
+                self.assertIn((b'Content-Type', b'text/event-stream'), start['headers'])
+                snapshot = (await spectator.receive_output())['body'].decode()
+                self.assertTrue(snapshot.startswith('id: {}\nevent: game\ndata: '.format(self.game.version)))
+                self.assertEqual(json.loads(snapshot.split('data: ')[1])['game_state'], 'C')
+
+            response = await sync_to_async(self.client.post)('/api/games/{}/flag/'.format(self.game.id),
+                                                             {'x': 1, 'y': 2})
+            self.assertEqual(response.status_code, 200)
+            frames = [await spectator.receive_output() for spectator in spectators]
+            self.assertTrue(all(frame['body'] is frames[0]['body'] for frame in frames))
+            self.assertTrue(frames[0]['more_body'])
+            delta = frames[0]['body'].decode()
+            self.assertTrue(delta.startswith('id: {}\nevent: delta\n'.format(self.game.version + 1)))
+            self.assertEqual(json.loads(delta.split('data: ')[1])['tiles'], [[1, 2, 192]])
+
+            for spectator in spectators:
+                await spectator.send_input({'type': 'http.disconnect'})
+                await spectator.wait()
+
+        async_to_sync(watch)()
+
+    def test_moves_are_not_encoded_without_spectators(self):
+        with mock.patch('game.events.move_event') as move_event:
+            response = self.client.post('/api/games/{}/flag/'.format(self.game.id), {'x': 1, 'y': 2})
+        self.assertEqual(response.status_code, 200)
+        move_event.assert_not_called()
+
+    def test_finished_game_ends_the_stream(self):
+        Game.objects.filter(pk=self.game.id).update(game_state='L')
+
+        async def watch():
+            spectator = self.events()
+            await spectator.send_input({'type': 'http.request'})
+            await spectator.receive_output()
+            self.assertFalse((await spectator.receive_output())['more_body'])
+            await spectator.wait()
+
+        async_to_sync(watch)()
+
+    def test_unknown_game_is_not_found(self):
+        async def watch():
+            response = await self.events(self.game.id + 1).get_response()
+            self.assertEqual(response['status'], 404)
+
+        async_to_sync(watch)()
+
+
+class TestConcurrentMoves(TransactionTestCase):
+    def setUp(self):
+        self.game = Game.objects.create(width=16, height=16)
+
+    def test_stale_copy_replays_move(self):
+        first = Game.objects.get(id=self.game.id)
+        second = Game.objects.get(id=self.game.id)
+        first.play('flag', 0, 0)
+        second.play('flag', 1, 0)
+
+        self.assertEqual(second.version, 3)
+        self.assertEqual(Game.objects.get(id=self.game.id).client_state[0][:2], [192, 192])
+
+    def test_parallel_moves_are_not_lost(self):
+        errors = []
+
+        def flag_row(y):
+            try:
+                for x in range(0, 16):
+                    Game.objects.get(id=self.game.id).play('flag', x, y)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=flag_row, args=(y,)) for y in range(0, 4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        game = Game.objects.get(id=self.game.id)
+        self.assertEqual(game.version, 65)
+        for row in game.client_state[:4]:
+            self.assertEqual(row, [192] * 16)
+
+    def test_finished_game_rejects_replayed_move(self):
+        stale = Game.objects.get(id=self.game.id)
+        Game.objects.filter(id=self.game.id).update(game_state='L', version=2)
+        with self.assertRaises(ValueError):
+            stale.play('flag', 0, 0)
+
+
+class TestBatchMoves(TestCase):
+    def setUp(self):
+        self.game = Game.objects.create(width=16, height=16)
+        self.url = '/api/games/{}/moves/?delta=true'.format(self.game.id)
+
+    def test_moves_are_saved_once(self):
+        moves = [{'move': 'flag', 'x': x, 'y': 0} for x in range(0, 3)] + [{'move': 'reveal', 'x': 8, 'y': 8}]
+        response = self.client.post(self.url, {'moves': moves}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['applied'], 4)
+
+        game = Game.objects.get(id=self.game.id)
+        self.assertEqual(game.version, 2)
+        self.assertEqual(game.game_state, 'S')
+        # the opening can spread over the flags and reveal them
+        for value in game.client_state[0][:3]:
+            self.assertTrue(value == 192 or not is_hidden(value))
+        self.assertEqual([tile[:2] for tile in response.data['tiles'][:3]], [[0, 0], [1, 0], [2, 0]])
+
+    def test_moves_stop_at_game_end(self):
+        self.game.reveal(0, 0)
+        self.game.save()
+        bomb = next(index for index, tile in enumerate(self.game.state) if is_bomb(tile))
+        x, y = tile_coordinates(bomb, 16)
+        moves = [{'move': 'reveal', 'x': x, 'y': y}, {'move': 'flag', 'x': x, 'y': y}]
+        response = self.client.post(self.url, {'moves': moves}, content_type='application/json')
+        self.assertEqual(response.data['applied'], 1)
+        self.assertEqual(response.data['game_state'], 'L')
+
+    def test_invalid_move_rejects_batch(self):
+        moves = [{'move': 'flag', 'x': 0, 'y': 0}, {'move': 'reveal', 'x': 16, 'y': 0}]
+        response = self.client.post(self.url, {'moves': moves}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(self.url, {'moves': [{'move': 'dig', 'x': 0, 'y': 0}]},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Game.objects.get(id=self.game.id).version, 1)
+
+
+class TestChord(TestCase):
+    def setUp(self):
+        self.game = Game.objects.create(width=16, height=16)
+        self.game.reveal(8, 8)
+        # first revealed number with at least one hidden safe tile around it
+        for index, tile in enumerate(self.game.state):
+            around = neighbours(index, 16, 16)
+            if not is_hidden(tile) and extract_adjacent(tile) > 0 and \
+                    any(is_hidden(self.game.state[probe]) and not is_bomb(self.game.state[probe]) for probe in around):
+                self.number = tile_coordinates(index, 16)
+                self.bombs = [probe for probe in around if is_bomb(self.game.state[probe])]
+                self.safe = [probe for probe in around if is_hidden(self.game.state[probe]) and
+                             not is_bomb(self.game.state[probe])]
+                break
+
+    def test_chord_reveals_neighbours(self):
+        for bomb in self.bombs:
+            self.game.flag(*tile_coordinates(bomb, 16))
+        safe_remaining = self.game.safe_remaining
+        revealed = self.game.chord(*self.number)
+
+        self.assertTrue(set(self.safe).issubset(revealed))
+        self.assertEqual(self.game.safe_remaining, safe_remaining - len(revealed))
+        for probe in self.safe:
+            self.assertFalse(is_hidden(self.game.state[probe]))
+
+    def test_chord_needs_matching_flags(self):
+        with self.assertRaises(ValueError):
+            self.game.chord(*self.number)
+
+    def test_wrong_flag_loses(self):
+        for bomb in self.bombs[1:]:
+            self.game.flag(*tile_coordinates(bomb, 16))
+        self.game.flag(*tile_coordinates(self.safe[0], 16))
+        self.game.chord(*self.number)
+        self.assertEqual(self.game.game_state, 'L')
+
+    def test_chord_action(self):
+        self.game.save()
+        for bomb in self.bombs:
+            self.game.play('flag', *tile_coordinates(bomb, 16))
+        x, y = self.number
+        response = self.client.post('/api/games/{}/chord/?delta=true'.format(self.game.id), {'x': x, 'y': y})
+        self.assertEqual(response.status_code, 200)
+        for probe in self.safe:
+            self.assertIn(list(tile_coordinates(probe, 16)), [tile[:2] for tile in response.data['tiles']])
+
+
+class TestGameCache(TestCase):
+    def setUp(self):
+        caches[GAME_CACHE].clear()
+        self.game = Game.objects.create(width=16, height=16)
+        self.client.post('/api/games/{}/reveal/'.format(self.game.id), {'x': 8, 'y': 8})
+
+    def flag(self, x, y):
+        return self.client.post('/api/games/{}/flag/?delta=true'.format(self.game.id), {'x': x, 'y': y})
+
+    def test_moves_skip_loading_the_game(self):
+        hidden = next(index for index, tile in enumerate(Game.objects.get(id=self.game.id).state) if is_hidden(tile))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.flag(*tile_coordinates(hidden, 16))
+        # the move is saved and logged, the game is never selected and its board is not written
+        queries = [query['sql'] for query in queries if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual([query.split()[0] for query in queries], ['UPDATE', 'INSERT'])
+        self.assertNotIn('"state"', queries[0])
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(is_flagged(Game.objects.get(id=self.game.id).state[hidden]))
+
+    def test_stale_cache_does_not_lose_moves(self):
+        stale = load_game(self.game.id)
+        game = Game.objects.get(id=self.game.id)
+        hidden = [index for index, tile in enumerate(game.state) if is_hidden(tile)]
+        game.play('flag', *tile_coordinates(hidden[0], 16))
+        self.assertEqual(load_game(self.game.id).version, stale.version)
+
+        self.flag(*tile_coordinates(hidden[1], 16))
+        state = Game.objects.get(id=self.game.id).state
+        self.assertTrue(is_flagged(state[hidden[0]]))
+        self.assertTrue(is_flagged(state[hidden[1]]))
+
+    def test_saves_and_deletes_drop_cached_game(self):
+        self.assertEqual(load_game(self.game.id).game_state, 'S')
+        Game.objects.get(id=self.game.id).delete()
+        self.assertEqual(self.flag(0, 0).status_code, 404)
+
+
+class TestBoardPool(TestCase):
+    def test_first_reveal_takes_pooled_board(self):
+        self.assertEqual(fill_board_pool(DENSITY, limit=2)[(16, 16)], 2)
+        game = Game.objects.create(width=16, height=16)
+        game.flag(3, 3)
+        game.reveal(8, 8)
+
+        self.assertEqual(PooledBoard.objects.filter(width=16, height=16).count(), 1)
+        self.assertEqual(BoardPoolStats.objects.get(width=16, height=16).hits, 1)
+        self.assertEqual(count_bombs(game.state), game.bombs)
+        self.assertFalse(is_bomb(game.state[tile_index(8, 8, 16)]))
+        self.assertTrue(is_flagged(game.state[tile_index(3, 3, 16)]) or not is_hidden(game.state[tile_index(3, 3, 16)]))
+
+    def test_empty_pool_generates_board(self):
+        game = Game.objects.create(width=16, height=16)
+        game.reveal(8, 8)
+        self.assertEqual(count_bombs(game.state), game.bombs)
+        self.assertEqual(BoardPoolStats.objects.get(width=16, height=16).misses, 1)
+
+    def test_bomb_under_first_reveal_moves_to_random_tile(self):
+        board = generate_game(generate_empty_game(16, 16), 16, 16, 0, 0, DENSITY, seed=1)
+        clicked = next(index for index, tile in enumerate(board) if is_bomb(tile))
+        targets = set()
+        for _ in range(0, 10):
+            PooledBoard.objects.create(width=16, height=16, bombs=count_bombs(board), state=bytes(board))
+            grid = generate_empty_game(16, 16)
+            self.assertTrue(take_pooled_board(grid, 16, 16, count_bombs(board), *tile_coordinates(clicked, 16)))
+            self.assertFalse(is_bomb(grid[clicked]))
+            self.assertEqual(count_bombs(grid), count_bombs(board))
+            targets.update(index for index, tile in enumerate(grid) if is_bomb(tile) and not is_bomb(board[index]))
+        self.assertGreater(len(targets), 1)
+
+    def test_stats_row_created_by_another_worker(self):
+        BoardPoolStats.objects.create(width=16, height=16, bombs=38, hits=1)
+        update = QuerySet.update
+        missed = []
+
+        def update_after_other_worker(queryset, **kwargs):
+            # The first update runs before the other worker has created the row
+            if not missed:
+                missed.append(True)
+                return 0
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', update_after_other_worker):
+            record_pool_use(16, 16, 38, 'hits')
+        self.assertEqual(BoardPoolStats.objects.get(width=16, height=16).hits, 2)
+
+    def test_move_bomb_keeps_counts(self):
+        grid = generate_game(generate_empty_game(8, 8), 8, 8, 0, 0, density=0.5, seed=3)
+        bomb = next(index for index, tile in enumerate(grid) if is_bomb(tile))
+        move_bomb(grid, 8, 8, bomb, 0)
+        self.assertTrue(is_bomb(grid[0]))
+        self.assertFalse(is_bomb(grid[bomb]))
+        for index, tile in enumerate(grid):
+            if not is_bomb(tile):
+                bombs = len([probe for probe in neighbours(index, 8, 8) if is_bomb(grid[probe])])
+                self.assertEqual(extract_adjacent(tile), bombs)
+
+
+class TestSolver(TestCase):
+    def test_single_point(self):
+        # a 1 in the corner with a single hidden tile next to it that is not next to anything else
+        grid = bytearray([1, 128, 0, 1])
+        safe, mines = Solver(grid, 2, 2, 1).solve()
+        self.assertEqual(mines, {1})
+        self.assertEqual(safe, set())
+
+    def test_subset(self):
+        # the 1 in the bottom left shares its only bomb with the 1 next to it, so the right column must be safe
+        hidden = create_tile(True, False, False)
+        grid = bytearray([hidden, hidden, hidden, 1, 1, hidden])
+        safe, mines = Solver(grid, 3, 2, 1).solve()
+        self.assertEqual(safe, {2, 5})
+        self.assertEqual(mines, set())
+
+    def test_no_guess_boards_are_solvable(self):
+        for seed in range(0, 3):
+            grid = generate_empty_game(16, 16)
+            attempts, solvable = generate_no_guess_game(grid, 16, 16, 8, 8, seed=seed)
+            self.assertTrue(solvable)
+            self.assertEqual(count_bombs(grid), 38)
+            self.assertEqual(extract_adjacent(grid[tile_index(8, 8, 16)]), 0)
+            self.assertTrue(is_solvable(grid, 16, 16, 8, 8, 38))
+
+    def test_no_guess_game(self):
+        response = self.client.post('/api/games/', {'width': 16, 'height': 16, 'no_guess': True})
+        self.assertTrue(response.data['no_guess'])
+        response = self.client.post('/api/games/{}/reveal/'.format(response.data['id']), {'x': 0, 'y': 0})
+        self.assertEqual(response.data['client_state'][0][0], 0)
+        self.assertTrue(response.data['no_guess'])
+
+    def test_no_guess_game_without_solvable_board(self):
+        game = Game.objects.create(width=16, height=16, no_guess=True)
+        with mock.patch('game.models.helpers.solver.is_solvable', return_value=False):
+            game.play('reveal', 8, 8)
+        self.assertFalse(game.no_guess)
+        self.assertFalse(Game.objects.get(id=game.id).no_guess)
+
+
+class TestHints(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.game = Game.objects.create(width=16, height=16)
+        self.game.reveal(8, 8)
+        self.game.save()
+        self.url = '/api/games/{}/hint/'.format(self.game.id)
+
+    def test_hints_are_correct(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        for x, y in response.data['safe']:
+            self.assertFalse(is_bomb(self.game.state[tile_index(x, y, 16)]))
+        for x, y in response.data['mines']:
+            self.assertTrue(is_bomb(self.game.state[tile_index(x, y, 16)]))
+        for x, y, probability in response.data.get('probabilities', []):
+            self.assertTrue(0 <= probability <= 1)
+
+    def test_hints_only_use_client_view(self):
+        # moving a hidden bomb without changing what the client sees must not change the hint
+        before = self.client.get(self.url).data
+        board = bytearray(self.game.state)
+        hidden = [index for index, tile in enumerate(board) if is_hidden(tile)]
+        for index in hidden:
+            board[index] = create_tile(True, False, False)
+        # games in progress are loaded from their latest snapshot and the moves after it
+        snapshot = self.game.snapshots.order_by('-number', '-id').first()
+        snapshot.state = bytes(board)
+        snapshot.save()
+        Game.objects.filter(id=self.game.id).update(version=self.game.version + 1)
+        caches[GAME_CACHE].clear()
+        self.assertEqual(Game.objects.get(id=self.game.id).state, bytes(board))
+        self.assertEqual(self.client.get(self.url).data, before)
+
+    def test_hints_are_cached_per_version(self):
+        self.client.get(self.url)
+        # only the version is read
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+
+    def test_stale_cached_game_is_not_used(self):
+        self.client.get(self.url)
+        store_game(self.game)
+        # another worker plays a move, leaving this worker's cached copy behind
+        other = Game.objects.get(id=self.game.id)
+        index = next(index for index, tile in enumerate(other.state) if is_hidden(tile) and not is_bomb(tile))
+        other.play('reveal', *tile_coordinates(index, 16))
+        if other.in_progress:
+            self.assertEqual(self.client.get(self.url).data, hint(other.client_board, 16, 16, other.bombs))
+        else:
+            self.assertEqual(self.client.get(self.url).status_code, 400)
+
+    def test_probabilities_when_guess_needed(self):
+        hidden = create_tile(True, False, False)
+        result = hint(bytearray([hidden, hidden, 1, 1]), 2, 2, 1)
+        self.assertEqual(result['safe'], [])
+        self.assertEqual(result['probabilities'], [[0, 0, 0.5], [1, 0, 0.5]])
+
+
+class TestGameListing(TestCase):
+    def setUp(self):
+        self.games = [Game.objects.create(width=16, height=16) for _ in range(5)]
+        self.games[0].reveal(8, 8)
+        self.games[0].save()
+
+    def test_listing_leaves_out_boards(self):
+        response = self.client.get('/api/games/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([game['id'] for game in response.data['results']], [game.id for game in reversed(self.games)])
+        self.assertNotIn('client_state', response.data['results'][0])
+
+    def test_listing_is_paginated(self):
+        response = self.client.get('/api/games/', {'page_size': 2})
+        self.assertEqual(len(response.data['results']), 2)
+        response = self.client.get(response.data['next'])
+        self.assertEqual([game['id'] for game in response.data['results']], [self.games[2].id, self.games[1].id])
+
+    def test_filter_by_game_state(self):
+        response = self.client.get('/api/games/', {'game_state': 'S'})
+        self.assertEqual([game['id'] for game in response.data['results']], [self.games[0].id])
+
+    def test_unknown_game_state_is_rejected(self):
+        response = self.client.get('/api/games/', {'game_state': ['S', 'X']})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('game_state', response.data)
+
+
+class TestRenderers(TestCase):
+    def setUp(self):
+        self.game = Game.objects.create(width=16, height=8)
+        self.game.flag(0, 0)
+        self.game.reveal(8, 4)
+        self.game.save()
+        self.url = '/api/games/{}/'.format(self.game.id)
+
+    def test_table_renderer_matches_json(self):
+        data = GameSerializer(self.game).data
+        self.assertEqual(json.loads(GameJSONRenderer().render(data).decode()), json.loads(json.dumps(data)))
+        self.assertEqual(encode_board(data['client_state']), json.dumps(data['client_state'], separators=(',', ':')))
+
+    def test_indented_json_is_unchanged(self):
+        response = self.client.get(self.url, HTTP_ACCEPT='application/json; indent=4')
+        self.assertEqual(json.loads(response.content.decode())['client_state'], self.game.client_state)
+        self.assertIn(b'\n', response.content)
+
+    def test_base64_board(self):
+        for kwargs in ({'HTTP_ACCEPT': Base64BoardRenderer.media_type}, {'data': {'format': 'base64'}}):
+            response = self.client.get(self.url, **kwargs)
+            self.assertEqual(response.status_code, 200)
+            board = base64.b64decode(json.loads(response.content.decode())['client_state'])
+            self.assertEqual(board, self.game.client_board)
+
+    def test_indented_base64_board(self):
+        response = self.client.get(self.url, HTTP_ACCEPT=Base64BoardRenderer.media_type + '; indent=2')
+        self.assertIn(b'\n', response.content)
+        board = base64.b64decode(json.loads(response.content.decode())['client_state'])
+        self.assertEqual(board, self.game.client_board)
+
+        renderer = Base64BoardRenderer()
+        renderer.compact = False
+        board = base64.b64decode(json.loads(renderer.render(GameSerializer(self.game).data).decode())['client_state'])
+        self.assertEqual(board, self.game.client_board)
+
+
+class TestMoveLog(TestCase):
+    def setUp(self):
+        self.game = Game.objects.create(width=16, height=16)
+        self.url = '/api/games/{}/'.format(self.game.id)
+
+    def play(self, move, x, y):
+        response = self.client.post(self.url + move + '/', {'x': x, 'y': y})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_replay_every_move(self):
+        games = [self.client.get(self.url).data, self.play('flag', 0, 0), self.play('reveal', 8, 8)]
+        game = Game.objects.get(id=self.game.id)
+        hidden = [index for index, tile in enumerate(game.state) if is_hidden(tile) and not is_bomb(tile)]
+        games.append(self.play('reveal', *tile_coordinates(hidden[-1], 16)))
+        # the opening can spread over the first flag, so the last flag goes on a tile still hidden
+        game = Game.objects.get(id=self.game.id)
+        hidden = [index for index, tile in enumerate(game.state) if is_hidden(tile)]
+        games.append(self.play('flag', *tile_coordinates(hidden[0], 16)))
+
+        self.assertEqual(list(game.move_log.values_list('number', 'move')),
+                         [(1, 'flag'), (2, 'reveal'), (3, 'reveal'), (4, 'flag')])
+        for number, played in enumerate(games):
+            response = self.client.get(self.url + 'replay/', {'move': number})
+            self.assertEqual(response.status_code, 200)
+            for field in ('client_state', 'game_state', 'start_time', 'move_count'):
+                self.assertEqual(response.data[field], played[field], (number, field))
+        self.assertEqual(games[1]['game_state'], 'C')
+
+    def test_flags_from_before_the_move_log_are_kept(self):
+        board = bytearray(self.game.state)
+        board[0] = set_flagged(True, board[0])
+        Game.objects.filter(id=self.game.id).update(state=bytes(board))
+        importlib.import_module('game.migrations.0012_move_log').snapshot_games(apps, None)
+
+        self.play('flag', 1, 0)
+        self.assertEqual(Game.objects.get(id=self.game.id).client_state[0][:3], [192, 192, 128])
+
+    def test_replay_uses_snapshots(self):
+        self.play('reveal', 8, 8)
+        game = Game.objects.get(id=self.game.id)
+        hidden = next(index for index, tile in enumerate(game.state) if is_hidden(tile))
+        with mock.patch('game.models.game.SNAPSHOT_INTERVAL', 4):
+            game.play_moves([('flag',) + tile_coordinates(hidden, 16)] * 9)
+        self.assertEqual(list(game.snapshots.values_list('number', flat=True)), [1, 4, 8])
+
+        # the reveal is move 1, so the tile is flagged after every even move
+        replayed = game.replay(10)
+        self.assertEqual(replayed.state, game.state)
+        self.assertEqual(replayed.safe_remaining, game.safe_remaining)
+        self.assertTrue(is_flagged(game.replay(8).state[hidden]))
+        self.assertFalse(is_flagged(game.replay(9).state[hidden]))
+
+    def test_saved_moves_are_logged(self):
+        self.game.flag(1, 1)
+        self.game.reveal(8, 8)
+        self.game.save()
+        self.assertEqual(self.game.move_log.count(), 2)
+        self.assertEqual(self.game.replay(2).state, self.game.state)
+
+    def test_board_is_rebuilt_from_the_move_log(self):
+        self.play('reveal', 8, 8)
+        game = Game.objects.get(id=self.game.id)
+        hidden = next(index for index, tile in enumerate(game.state) if is_hidden(tile))
+        with mock.patch('game.models.game.SNAPSHOT_INTERVAL', 4):
+            game.play_moves([('flag',) + tile_coordinates(hidden, 16)] * 5)
+
+        # the row still has the board the game was created with
+        stored = Game.objects.filter(id=self.game.id).values_list('state', flat=True).get()
+        self.assertEqual(bytes(stored), bytes(generate_empty_game(16, 16)))
+        with CaptureQueriesContext(connection) as queries:
+            loaded = Game.objects.get(id=self.game.id)
+        # the game, its latest snapshot and the two moves after it
+        self.assertEqual(len(queries), 3)
+        self.assertEqual(loaded.state, game.state)
+        self.assertTrue(is_flagged(loaded.state[hidden]))
+
+    def test_board_is_written_when_the_game_ends(self):
+        game = play_game(False)
+        stored = Game.objects.filter(id=game.id).values_list('state', flat=True).get()
+        self.assertEqual(bytes(stored), game.state)
+
+    def test_replay_past_last_move(self):
+        self.assertEqual(self.client.get(self.url + 'replay/', {'move': 1}).status_code, 400)
+        self.assertEqual(self.client.get(self.url + 'replay/', {'move': 'last'}).status_code, 400)
+
+
+def play_game(win):
+    """
+    Plays a 16x16 game to the end, revealing safe tiles to win or a bomb to lose
+    """
+    game = Game.objects.create(width=16, height=16)
+    game.play('reveal', 8, 8)
+    while game.in_progress:
+        index = next(index for index, tile in enumerate(game.state) if is_hidden(tile) and is_bomb(tile) != win)
+        game.play('reveal', *tile_coordinates(index, 16))
+    return game
+
+
+class TestStats(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_finished_games_are_counted(self):
+        won = play_game(True)
+        play_game(False)
+        stats = self.client.get('/api/stats/').data
+        self.assertEqual((stats['games'], stats['wins'], stats['win_rate']), (2, 1, 0.5))
+        self.assertEqual(stats['sizes'][0]['average_win_seconds'],
+                         (won.end_time - won.start_time).total_seconds())
+
+        response = self.client.get('/api/leaderboards/', {'width': 16, 'height': 16})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([entry['game'] for entry in response.data['entries']], [won.id])
+
+    def test_only_fastest_wins_are_kept(self):
+        start = timezone.now()
+        with mock.patch('game.models.stats.LEADERBOARD_SIZE', 2):
+            for seconds in (30, 10, 20, 40):
+                game = Game.objects.create(width=16, height=16, game_state='W', start_time=start,
+                                           end_time=start + datetime.timedelta(seconds=seconds))
+                record_game_end(game)
+        self.assertEqual([entry['seconds'] for entry in leaderboard(16, 16, game.bombs)], [10, 20])
+        self.assertEqual(LeaderboardEntry.objects.count(), 2)
+
+    def test_stats_row_created_by_another_worker(self):
+        start = timezone.now()
+        game = Game.objects.create(width=16, height=16, game_state='L', start_time=start,
+                                   end_time=start + datetime.timedelta(seconds=10))
+        BoardStats.objects.create(width=16, height=16, bombs=game.bombs, games=1, seconds=5)
+        update = QuerySet.update
+        missed = []
+
+        def update_after_other_worker(queryset, **kwargs):
+            # The first update runs before the other worker has created the row
+            if not missed:
+                missed.append(True)
+                return 0
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', update_after_other_worker):
+            record_game_end(game)
+        stats = BoardStats.objects.get(width=16, height=16)
+        self.assertEqual((stats.games, stats.seconds), (2, 15))
+
+    def test_reads_are_cached(self):
+        play_game(True)
+        for url, params in (('/api/stats/', {}), ('/api/leaderboards/', {'width': 16, 'height': 16})):
+            self.client.get(url, params)
+            with self.assertNumQueries(0):
+                self.client.get(url, params)
+
+    def test_leaderboard_needs_size(self):
+        self.assertEqual(self.client.get('/api/leaderboards/', {'width': 16}).status_code, 400)
+
+
+class TestScratchBenchmarks(TransactionTestCase):
+    def test_api_load_test_uses_scratch_database(self):
+        game = Game.objects.create(width=16, height=16)
+        results = bench_api(games=2, moves=3)
+        self.assertGreater(results['requests per second'], 0)
+        self.assertLessEqual(results['reveal p50 (ms)'], results['reveal p99 (ms)'])
+        self.assertEqual(list(Game.objects.values_list('id', flat=True)), [game.id])
+        self.assertIsNone(caches[GAME_CACHE].get('game:{}'.format(game.id)))
+
+    def test_json_output(self):
+        out = io.StringIO()
+        with mock.patch.dict(BENCHMARKS, {'api': lambda: bench_api(games=1, moves=2)}, clear=True):
+            call_command('benchmark', '--json', stdout=out)
+        results = json.loads(out.getvalue())['api']
+        for label in ('create p50 (ms)', 'create p99 (ms)', 'reveal p50 (ms)', 'reveal p99 (ms)',
+                      'requests per second'):
+            self.assertIn(label, results)
+
+    def test_sqlite_writes_from_several_processes(self):
+        game = Game.objects.create(width=16, height=16)
+        results = bench_sqlite_writes(processes=(2,), moves=10, games=2)
+        for mode in ('rollback', 'wal'):
+            # Moves may fail when the disk is slow, but most of them must be saved
+            self.assertGreater(results['{} with 2 processes saved'.format(mode)], 10)
+            self.assertGreater(results['{} with 2 processes (moves/s)'.format(mode)], 0)
+        self.assertEqual(list(Game.objects.values_list('id', flat=True)), [game.id])
+        self.assertEqual(Game.objects.get().move_count, 0)
+
+
+class TestBenchmarks(TestCase):
+    def test_export_is_rolled_back(self):
+        results = bench_export(cases=((3, 8), (1, 64)), batch=2)
+        self.assertGreater(results['3 games of 8x8 (games/s)'], 0)
+        self.assertGreater(results['1 games of 64x64 peak memory (MB)'], 0)
+        self.assertEqual(Game.objects.count(), 0)
+
+    def test_spectators(self):
+        results = bench_spectators(spectators=(3,), size=16, number=2)
+        self.assertGreater(results['3 spectators polling (ms)'], 0)
+        self.assertGreater(results['3 spectators broadcast (ms)'], 0)
+
+
+class TestMetrics(TestCase):
+    def test_histogram_buckets(self):
+        histogram = Histogram('test_seconds', 'Test', ('stage',))
+        for seconds in (0.00005, 0.003, 0.003, 20):
+            histogram.observe(seconds, 'a')
+        lines = histogram.render()
+        self.assertIn('test_seconds_bucket{stage="a",le="0.0001"} 1', lines)
+        self.assertIn('test_seconds_bucket{stage="a",le="0.0025"} 1', lines)
+        self.assertIn('test_seconds_bucket{stage="a",le="0.005"} 3', lines)
+        self.assertIn('test_seconds_bucket{stage="a",le="10"} 3', lines)
+        self.assertIn('test_seconds_bucket{stage="a",le="+Inf"} 4', lines)
+        self.assertIn('test_seconds_count{stage="a"} 4', lines)
+
+    def test_moves_are_timed(self):
+        game = Game.objects.create(width=16, height=16)
+        self.client.post('/api/games/{}/reveal/'.format(game.id), {'x': 8, 'y': 8})
+        text = self.client.get('/metrics').content.decode()
+        for stage in ('load', 'deserialize_game', 'generate', 'propagate_unhide', 'serialize_game', 'commit',
+                      'serializer', 'render'):
+            self.assertIn('minesweeper_stage_seconds_count{{stage="{}"}}'.format(stage), text)
+        self.assertIn('minesweeper_request_seconds_count{action="reveal"}', text)
+        self.assertIn('minesweeper_responses_total{action="reveal",status="200"}', text)
+
+    def test_stack_sampler(self):
+        sampler = StackSampler(0.01)
+        sampler.sample()
+        self.assertIn('test_stack_sampler (tests.py)', sampler.collapsed())
+
+    def test_profile_is_for_admins(self):
+        self.assertEqual(self.client.get('/metrics/profile').status_code, 403)
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        self.assertEqual(self.client.get('/metrics/profile').status_code, 404)
+
+    def test_sampler_starts_on_first_request(self):
+        self.addCleanup(setattr, profiler, 'SAMPLER', None)
+        self.addCleanup(request_started.disconnect, dispatch_uid='game.profiler')
+        with self.settings(GAME_PROFILER_INTERVAL=0.01), mock.patch.object(StackSampler, 'start'):
+            apps.get_app_config('game').ready()
+            self.assertIsNone(profiler.SAMPLER)
+            self.client.get('/metrics')
+            self.assertEqual(profiler.SAMPLER.interval, 0.01)
+
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        response = self.client.get('/metrics/profile')
+        self.assertEqual(response.status_code, 200)
+
+
+class TestETags(TestCase):
+    def setUp(self):
+        self.game = Game.objects.create(width=16, height=16)
+        self.url = '/api/games/{}/'.format(self.game.id)
+
+    def test_unchanged_game_is_not_sent(self):
+        etag = self.client.get(self.url)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('"state"', queries[0]['sql'])
+
+    def test_moves_change_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        moved = self.client.post(self.url + 'flag/', {'x': 0, 'y': 0})['ETag']
+        self.assertNotEqual(moved, etag)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='W/{}, "other"'.format(moved)).status_code, 304)
+        moved = self.client.post(self.url + 'reveal/', {'x': 8, 'y': 8})['ETag']
+        self.assertEqual(self.client.get(self.url)['ETag'], moved)
+
+    def test_delta_etag_is_weak(self):
+        etag = self.client.get(self.url)['ETag']
+        moved = self.client.post(self.url + 'flag/?delta=true', {'x': 0, 'y': 0})['ETag']
+        self.assertTrue(moved.startswith('W/'))
+        self.assertEqual(self.client.get(self.url)['ETag'], moved[2:])
+        self.assertNotEqual(moved[2:], etag)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=moved).status_code, 304)
+
+    def test_etag_depends_on_format(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, {'format': 'base64'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_unknown_game(self):
+        self.assertEqual(self.client.get('/api/games/999/', HTTP_IF_NONE_MATCH='"1-json"').status_code, 404)
+
+
+class TestArchive(TestCase):
+    def finished_game(self, days_ago):
+        game = play_game(False)
+        Game.objects.filter(id=game.id).update(end_time=timezone.now() - datetime.timedelta(days=days_ago))
+        return game
+
+    def test_old_finished_games_are_archived(self):
+        old = self.finished_game(40)
+        recent = self.finished_game(1)
+        moves = list(old.move_log.order_by('number').values_list('move', 'x', 'y'))
+
+        self.assertEqual(archive_finished_games(30, batch=1), 1)
+        archived = ArchivedGame.objects.get(id=old.id)
+        self.assertEqual(zlib.decompress(archived.state), old.state)
+        self.assertEqual(unpack_moves(archived.moves), moves)
+        self.assertEqual(archived.move_count, len(moves))
+        self.assertFalse(Game.objects.filter(id=old.id).exists())
+        self.assertFalse(Move.objects.filter(game=old.id).exists())
+        self.assertTrue(Game.objects.filter(id=recent.id).exists())
+
+    def test_boards_are_read_a_few_tiles_at_a_time(self):
+        games = [self.finished_game(40), self.finished_game(40)]
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(archive_games(Game.objects.filter(pk__in=[game.id for game in games]), 10, tiles=1), 2)
+        boards = [query for query in queries if query['sql'].startswith('SELECT') and '"state"' in query['sql']]
+        self.assertEqual(len(boards), 2)
+        self.assertEqual(ArchivedGame.objects.count(), 2)
+
+    def test_leaderboard_games_are_kept(self):
+        won = play_game(True)
+        Game.objects.filter(id=won.id).update(end_time=timezone.now() - datetime.timedelta(days=40))
+        self.assertEqual(archive_finished_games(30, batch=10), 0)
+
+    def test_unstarted_games_are_dropped(self):
+        games = [Game.objects.create(width=16, height=16) for _ in range(3)]
+        games[2].play('reveal', 8, 8)
+        Game.objects.update(created_time=timezone.now() - datetime.timedelta(days=2))
+        recent = Game.objects.create(width=16, height=16)
+
+        out = io.StringIO()
+        call_command('archive_games', '--no-vacuum', '--batch', '1', stdout=out)
+        self.assertIn('deleted 2 games never started', out.getvalue())
+        self.assertEqual(set(Game.objects.values_list('id', flat=True)), {games[2].id, recent.id})
+
+
+class TestExport(TestCase):
+    def setUp(self):
+        self.won = play_game(True)
+        self.lost = play_game(False)
+        Game.objects.create(width=16, height=16)
+        ago = datetime.timedelta(days=40)
+        Game.objects.filter(id=self.lost.id).update(start_time=F('start_time') - ago, end_time=F('end_time') - ago)
+        self.lost.refresh_from_db()
+        archive_finished_games(30, batch=10)
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+
+    def check_games(self, games):
+        self.assertEqual([int(game['id']) for game in games], [self.won.id, self.lost.id])
+        for game, played in zip(games, (self.won, self.lost)):
+            self.assertEqual(json.loads(game['board']) if isinstance(game['board'], str) else game['board'],
+                             played.client_state)
+            self.assertEqual(float(game['seconds']), (played.end_time - played.start_time).total_seconds())
+            self.assertEqual(int(game['move_count']), played.move_count)
+
+    def test_ndjson(self):
+        response = self.client.get('/api/export/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.check_games([json.loads(line) for line in lines])
+
+    def test_csv(self):
+        response = self.client.get('/api/export/', {'format': 'csv'})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.check_games(list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode()))))
+
+    def test_games_are_read_in_batches(self):
+        with CaptureQueriesContext(connection) as queries:
+            lines = ''.join(export_games('ndjson', batch=1)).splitlines()
+        self.assertEqual(len(lines), 2)
+        # the size then the board of a game, then an empty batch, from the games table and from the archive
+        self.assertEqual(len(queries), 6)
+
+    def test_big_boards_are_read_on_their_own(self):
+        sizes = [(1, 16, 16), (2, 16, 16), (3, 1024, 1024), (4, 8, 8), (5, 16, 16)]
+        self.assertEqual(list(board_groups(sizes, 600)), [[1, 2], [3], [4, 5]])
+        lines = ''.join(export_games('ndjson', tiles=1)).splitlines()
+        self.check_games([json.loads(line) for line in lines])
+
+    def test_admins_only(self):
+        self.client.logout()
+        response = self.client.get('/api/export/', {'format': 'csv'})
+        self.assertEqual(response.status_code, 403)
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('export_games', '--format', 'csv', '--batch', '1', stdout=out)
+        self.check_games(list(csv.DictReader(io.StringIO(out.getvalue()))))
+
+
+class TestSQLiteMode(TestCase):
+    def test_connections_use_wal(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA synchronous')
+            # 1 is NORMAL
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+
+class TestVacuum(TransactionTestCase):
+    def test_space_is_reclaimed(self):
+        Game.objects.bulk_create([Game(width=64, height=64, state=bytes(64 * 64)) for _ in range(50)])
+        Game.objects.update(created_time=timezone.now() - datetime.timedelta(days=2))
+        out = io.StringIO()
+        call_command('archive_games', stdout=out)
+        self.assertIn('deleted 50 games never started', out.getvalue())
+        self.assertRegex(out.getvalue(), r'reclaimed [1-9]\d+ bytes')
@@ -1,53 +1,232 @@
-from game.models.game import Game
+import time
+
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.http import parse_etags
+from game.cache import load_game, store_game, forget_game
+from game.events import publish_move
+from game.export import export_games
+from game.metrics import timed, render_metrics, REQUESTS, RESPONSES
+from game import profiler
+from game.models.game import Game, MoveConflict, DENSITY
+from game.models.helpers.board import bomb_count
+from game.models.stats import leaderboard, game_stats
+from game.models.helpers.solver import hint
 from rest_framework import viewsets, status
 from rest_framework.permissions import IsAdminUser, AllowAny
-from game.serializers import GameSerializer, GameSerializerWithReadOnlyDimensions, MoveSerializer
+from game.serializers import GameSerializer, GameSerializerWithReadOnlyDimensions, GameDeltaSerializer, \
+    MoveSerializer, BatchSerializer, GameSummarySerializer, LeaderboardSerializer
 from rest_framework.response import Response
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
+from rest_framework.renderers import BrowsableAPIRenderer
+from game.renderers import GameJSONRenderer, Base64BoardRenderer, NDJSONRenderer, CSVRenderer
 
 # Create your views here.
 
 
+class GamePagination(CursorPagination):
+    ordering = '-id'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
 class GameViewSet(viewsets.ModelViewSet):
     """
     API for Games
     """
     queryset = Game.objects.all().order_by('-id')
     serializer_class = GameSerializer
+    pagination_class = GamePagination
+    renderer_classes = (GameJSONRenderer, Base64BoardRenderer, BrowsableAPIRenderer)
+
+    def dispatch(self, request, *args, **kwargs):
+        started = time.perf_counter()
+        response = super().dispatch(request, *args, **kwargs)
+        action = self.action or 'unknown'
+        REQUESTS.observe(time.perf_counter() - started, action)
+        RESPONSES.inc(action, response.status_code)
+        return response
+
+    def get_queryset(self):
+        queryset = self.queryset
+        if self.action == 'list':
+            # Listings never show the board, so leave it in the database
+            queryset = queryset.defer('state')
+            states = self.request.query_params.getlist('game_state')
+            unknown = [state for state in states if state not in dict(Game.GAME_STATES)]
+            if unknown:
+                raise ValidationError({'game_state': ['Must be one of {}'.format(
+                    ', '.join(state for state, name in Game.GAME_STATES))]})
+            if states:
+                queryset = queryset.filter(game_state__in=states)
+        return queryset
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        The game, or 304 Not Modified when If-None-Match has its current ETag.
+        The ETag is checked from the version alone, without loading the board.
+        """
+        if request.META.get('HTTP_IF_NONE_MATCH'):
+            etag = self.etag(self.get_version())
+            matches = [tag[2:] if tag.startswith('W/') else tag
+                       for tag in parse_etags(request.META['HTTP_IF_NONE_MATCH'])]
+            if etag in matches or '*' in matches:
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        game = self.get_object()
+        return Response(self.get_serializer(game).data, headers={'ETag': self.etag(game.version)})
+
+    def etag(self, version, weak=False):
+        """
+        ETag of a version of a game, games go up a version with every move. The format is part of the tag, as the board
+        is sent differently in each.
+        :param weak: the response is not the whole game, only a change to this version of it
+        """
+        return '{}"{}-{}"'.format('W/' if weak else '', version, self.request.accepted_renderer.format)
 
     @action(methods=['post'], detail=True)
     def flag(self, request, pk):
-        game = self.get_object()
-        serializer = MoveSerializer(data=request.data)
-        if not (game.game_state == 'S' or game.game_state == 'C'):
+        return self.apply_move(request, 'flag')
+
+    @action(methods=['post'], detail=True)
+    def reveal(self, request, pk):
+        return self.apply_move(request, 'reveal')
+
+    @action(methods=['post'], detail=True)
+    def chord(self, request, pk):
+        return self.apply_move(request, 'chord')
+
+    @action(methods=['post'], detail=True)
+    def moves(self, request, pk):
+        """
+        Applies a list of moves in order and saves them all at once, moves after one that ends the game are skipped
+        """
+        game = self.get_game()
+        serializer = BatchSerializer(data=request.data, context={'game': game})
+        if not game.in_progress:
             return Response({'status': 'Cannot update completed game'}, status=status.HTTP_400_BAD_REQUEST)
-        if serializer.is_valid():
-            game.flag(serializer.validated_data.get('x'), serializer.validated_data.get('y'))
-            game.save()
-            return Response(GameSerializer(game).data)
-        else:
+        if not serializer.is_valid():
             return Response(serializer.errors,
                             status=status.HTTP_400_BAD_REQUEST)
 
-    @action(methods=['post'], detail=True)
-    def reveal(self, request, pk):
-        game = self.get_object()
-        serializer = MoveSerializer(data=request.data)
-        if not (game.game_state == 'S' or game.game_state == 'C'):
+        return self.play(game, [(move['move'], move['x'], move['y']) for move in serializer.validated_data['moves']])
+
+    @action(methods=['get'], detail=True)
+    def hint(self, request, pk):
+        """
+        Tiles that are certainly safe or certainly bombs going by what the player can see, and the chance of each tile
+        being a bomb when none are certainly safe. Hints are cached until the next move.
+        Hints are not saved like moves are, so the version is always read from the database rather than trusting the
+        game cache, which another worker's move may have left behind.
+        """
+        version = self.get_version()
+        key = 'hint:{}:{}'.format(pk, version)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+
+        game = self.get_game(version)
+        if game.game_state == 'C':
+            return Response({'status': 'The first reveal is always safe'}, status=status.HTTP_400_BAD_REQUEST)
+        if not game.in_progress:
+            return Response({'status': 'Cannot hint completed game'}, status=status.HTTP_400_BAD_REQUEST)
+
+        with timed('hint'):
+            data = hint(game.client_board, game.width, game.height, game.bombs)
+        # Keyed by the version the hint was worked out from, in case another move was saved since checking it
+        cache.set('hint:{}:{}'.format(pk, game.version), data)
+        return Response(data)
+
+    @action(methods=['get'], detail=True)
+    def replay(self, request, pk):
+        """
+        The game as it was after ?move=<number> moves, rebuilt from the move log. Defaults to the latest move.
+        """
+        game = self.get_game()
+        try:
+            number = int(request.query_params.get('move', game.move_count))
+        except ValueError:
+            return Response({'status': 'Move must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            replayed = game.replay(number)
+        except ValueError as error:
+            return Response({'status': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(GameSerializer(replayed).data)
+
+    def apply_move(self, request, move):
+        game = self.get_game()
+        serializer = MoveSerializer(data=request.data, context={'game': game})
+        if not game.in_progress:
             return Response({'status': 'Cannot update completed game'}, status=status.HTTP_400_BAD_REQUEST)
-        if serializer.is_valid():
-            game.reveal(serializer.validated_data.get('x'), serializer.validated_data.get('y'))
-            game.save()
-            return Response(GameSerializer(game).data)
-        else:
+        if not serializer.is_valid():
             return Response(serializer.errors,
                             status=status.HTTP_400_BAD_REQUEST)
 
+        return self.play(game, [(move, serializer.validated_data.get('x'), serializer.validated_data.get('y'))])
+
+    def get_version(self):
+        """
+        The version of the game in the database, read without loading the board
+        """
+        try:
+            version = Game.objects.filter(pk=self.kwargs['pk']).values_list('version', flat=True).first()
+        except ValueError:
+            version = None
+        if version is None:
+            raise Http404
+        return version
+
+    def get_game(self, version=None):
+        """
+        Loads the game moves are played on, from the game cache when it is there, see load_game
+        """
+        try:
+            with timed('load'):
+                return load_game(self.kwargs['pk'], version)
+        except (Game.DoesNotExist, ValueError):
+            raise Http404
+
+    def play(self, game, moves):
+        try:
+            changed, applied = game.play_moves(moves)
+        except Game.DoesNotExist:
+            forget_game(game.pk)
+            raise Http404
+        except ValueError as error:
+            forget_game(game.pk)
+            return Response({'status': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        except MoveConflict as error:
+            forget_game(game.pk)
+            return Response({'status': str(error)}, status=status.HTTP_409_CONFLICT)
+        store_game(game)
+        publish_move(game, changed)
+
+        response = self.move_response(game, changed)
+        if self.action == 'moves':
+            response.data['applied'] = applied
+        return response
+
+    def move_response(self, game, changed):
+        """
+        Responds to a move with the whole game, or with only the changed tiles when ?delta=true is passed.
+        A delta has a weak ETag, it names the same version as the whole game but is not the same bytes.
+        """
+        with timed('serializer'):
+            if self.request.query_params.get('delta') in ('true', '1'):
+                data = GameDeltaSerializer(game, context={'tiles': changed}).data
+                return Response(data, headers={'ETag': self.etag(game.version, weak=True)})
+            return Response(GameSerializer(game).data, headers={'ETag': self.etag(game.version)})
+
     def get_serializer_class(self):
         serializer_class = self.serializer_class
 
         if self.request.method == 'PUT' or self.request.method == 'PATCH':
             serializer_class = GameSerializerWithReadOnlyDimensions
+        elif self.action == 'list':
+            serializer_class = GameSummarySerializer
 
         return serializer_class
 
@@ -58,3 +237,64 @@ class GameViewSet(viewsets.ModelViewSet):
             return [AllowAny()]
         else:
             return [AllowAny()]
+
+
+class StatsViewSet(viewsets.ViewSet):
+    """
+    Win rate and average game length over every finished game, and for each board size
+    """
+
+    def list(self, request):
+        return Response(game_stats())
+
+
+class LeaderboardViewSet(viewsets.ViewSet):
+    """
+    Fastest wins for the board size given by ?width= and ?height=
+    """
+
+    def list(self, request):
+        serializer = LeaderboardSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors,
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        width = serializer.validated_data['width']
+        height = serializer.validated_data['height']
+        bombs = serializer.validated_data.get('bombs', bomb_count(width, height, DENSITY))
+        return Response({'width': width, 'height': height, 'bombs': bombs,
+                         'entries': leaderboard(width, height, bombs)})
+
+
+class ExportViewSet(viewsets.ViewSet):
+    """
+    Every finished game, archived ones included, with its final board and timings. Sent as NDJSON, or CSV with
+    ?format=csv, and streamed as it is read so memory use stays the same however many games there are. Admins only.
+    """
+    permission_classes = (IsAdminUser,)
+    renderer_classes = (NDJSONRenderer, CSVRenderer)
+
+    def list(self, request):
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(export_games(renderer.format),
+                                         content_type='{}; charset={}'.format(renderer.media_type, renderer.charset))
+        response['Content-Disposition'] = 'attachment; filename="games.{}"'.format(renderer.format)
+        return response
+
+
+def metrics(request):
+    """
+    Timings of each API action and each stage of handling a move in this process, in the Prometheus text format
+    """
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@api_view(['GET'])
+@permission_classes((IsAdminUser,))
+def profile(request):
+    """
+    Stacks seen by the sampling profiler, only there when GAME_PROFILER_INTERVAL is set. Admins only.
+    """
+    if profiler.SAMPLER is None:
+        raise Http404
+    return HttpResponse(profiler.SAMPLER.collapsed(), content_type='text/plain; charset=utf-8')
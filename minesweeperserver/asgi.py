@@ -0,0 +1,19 @@
+"""
+ASGI config for minesweeperserver project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+It serves the same HTTP API as wsgi.py, plus the websocket routes in routing.py.
+
+For more information on this file, see
+https://channels.readthedocs.io/en/2.1.7/deploying.html
+"""
+
+import os
+
+import django
+from channels.routing import get_default_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'minesweeperserver.settings')
+django.setup()
+
+application = get_default_application()
@@ -0,0 +1,22 @@
+"""minesweeperserver ASGI routing
+
+Websocket connections and game event streams are routed here, other HTTP requests fall through to the regular Django
+views in urls.py.
+For more information please see:
+    https://channels.readthedocs.io/en/2.1.7/topics/routing.html
+"""
+from channels.http import AsgiHandler
+from channels.routing import ProtocolTypeRouter, URLRouter
+from django.urls import path, re_path
+from game.consumers import GameConsumer
+from game.events import GameEventsConsumer
+
+application = ProtocolTypeRouter({
+    'http': URLRouter([
+        path('api/games/<int:pk>/events/', GameEventsConsumer),
+        re_path(r'', AsgiHandler),
+    ]),
+    'websocket': URLRouter([
+        path('ws/games/<int:pk>/', GameConsumer),
+    ]),
+})
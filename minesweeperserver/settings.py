@@ -39,6 +39,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'rest_framework',
+    'channels',
     'game',
 ]
 
@@ -72,6 +73,18 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'minesweeperserver.wsgi.application'
+ASGI_APPLICATION = 'minesweeperserver.routing.application'
+
+# Channel layers carry moves between every socket and event stream open on a game
+# https://channels.readthedocs.io/en/2.1.7/topics/channel_layers.html
+# The local layer only reaches sockets in the same process, use a shared layer such as channels_redis when moves are
+# played in other processes
+
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'game.layers.LocalChannelLayer',
+    },
+}
 
 
 # Database
@@ -81,9 +94,71 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db/db.sqlite3'),
+        # Seconds to wait for another worker to finish writing before giving up with "database is locked"
+        'OPTIONS': {
+            'timeout': float(os.environ.get('SQLITE_BUSY_TIMEOUT', 20)),
+        },
+        # Seconds to keep connections open between requests, so each request does not reopen the database
+        'CONN_MAX_AGE': int(os.environ.get('CONN_MAX_AGE', 60)),
+        # Tests use a file too, in-memory databases fail straight away instead of waiting when a table is locked
+        'TEST': {
+            'NAME': os.path.join(BASE_DIR, 'db/test.sqlite3'),
+        },
     }
 }
 
+# How SQLite is set up on each connection, 'wal' or 'rollback', see game/database.py.
+# WAL lets workers keep reading while a move is saved, use it whenever there is more than one worker
+SQLITE_MODE = os.environ.get('SQLITE_MODE', 'wal')
+
+
+# Caches
+# https://docs.djangoproject.com/en/2.1/topics/cache/
+# Games in progress are cached in 'games' so moves skip loading them from the database.
+# The default is local to each process, with several workers point GAME_CACHE_BACKEND and GAME_CACHE_LOCATION
+# at a shared cache, for example django.core.cache.backends.filebased.FileBasedCache and a directory.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'games': {
+        'BACKEND': os.environ.get('GAME_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('GAME_CACHE_LOCATION', 'games'),
+        'TIMEOUT': 60 * 60,
+        'OPTIONS': {
+            # Least recently used games are dropped past this many
+            'MAX_ENTRIES': int(os.environ.get('GAME_CACHE_MAX_ENTRIES', 1000)),
+        },
+    },
+}
+
+# Bigger boards are not cached, so the cache holds at most MAX_ENTRIES * GAME_CACHE_MAX_BOARD_BYTES of boards
+GAME_CACHE_MAX_BOARD_BYTES = int(os.environ.get('GAME_CACHE_MAX_BOARD_BYTES', 64 * 1024))
+
+
+# Boards generated ahead of time for the most played sizes, so the first reveal does not have to generate one.
+# Keep the pool topped up with `python manage.py board_pool --loop`
+
+GAME_BOARD_POOL = {
+    # (width, height) of each pooled size, other sizes always generate their board on the first reveal
+    'SIZES': [(8, 8), (16, 16), (30, 16)],
+    # Boards kept ready for each size
+    'TARGET': int(os.environ.get('GAME_BOARD_POOL_TARGET', 50)),
+}
+
+# Old games cleaned up by `python manage.py archive_games`
+GAME_ARCHIVE = {
+    # Days after ending that finished games are moved to the archive
+    'FINISHED_DAYS': int(os.environ.get('GAME_ARCHIVE_FINISHED_DAYS', 30)),
+    # Days after being created that games never revealed are deleted
+    'UNSTARTED_DAYS': int(os.environ.get('GAME_ARCHIVE_UNSTARTED_DAYS', 1)),
+}
+
+# Seconds between samples of every thread's stack, unset to leave the profiler off.
+# Samples are served from /metrics/profile in the collapsed format flame graph tools read
+GAME_PROFILER_INTERVAL = float(os.environ.get('GAME_PROFILER_INTERVAL') or 0) or None
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
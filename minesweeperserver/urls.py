@@ -20,8 +20,13 @@ from game import views
 
 router = routers.DefaultRouter()
 router.register(r'api/games', views.GameViewSet)
+router.register(r'api/stats', views.StatsViewSet, base_name='stats')
+router.register(r'api/leaderboards', views.LeaderboardViewSet, base_name='leaderboards')
+router.register(r'api/export', views.ExportViewSet, base_name='export')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('admin/', admin.site.urls),
+    path('metrics', views.metrics),
+    path('metrics/profile', views.profile),
 ]